@@ -1,9 +1,25 @@
-import streamlit as st
-import requests
-import json
 import time
-from fpdf import FPDF
-import tempfile
+
+# Inicio del run: el primer run de un proceso incluye también las importaciones
+script_start = time.perf_counter()
+
+import streamlit as st
+import math
+import uuid
+import agent_client
+import context_window
+from response_cache import get_response_cache
+from dispatcher import get_dispatcher
+from resilience import CircuitBreaker, get_resilient_caller
+import metrics
+from conversation_store import get_conversation_store, user_key
+from scheduler import PRIORITY_INTERACTIVE, QueueTimeout, get_rate_limiter, get_scheduler
+import ui_shell
+from health_monitor import STATE_ICONS, get_health_monitor
+from knowledge_base import KB_THRESHOLD, get_knowledge_base
+from session_memory import SESSION_MAX_MESSAGES, ChatMessage, get_session_registry, trim_messages
+from voice import get_speech_synthesizer
+from prefetch import PREFETCH_ENABLED, get_prefetcher
 
 # Configuración de la página sin el parámetro theme (compatible con versiones anteriores)
 st.set_page_config(
@@ -14,105 +30,28 @@ st.set_page_config(
     menu_items=None
 )
 
-# Establecer tema claro mediante CSS personalizado
-st.markdown("""
-<style>
-    /* Tema claro personalizado para Tampa Clean */
-    body {
-        color: #262626;
-        background-color: #ffffff;
-    }
-    .stApp {
-        background-color: #ffffff;
-    }
-    .stTextInput>div>div>input {
-        background-color: #f8f9fa;
-        color: #262626;
-        border: 1px solid #dee2e6;
-    }
-    .stSlider>div>div>div {
-        color: #262626;
-    }
-    .stSelectbox>div>div>div {
-        background-color: #f8f9fa;
-        color: #262626;
-    }
-    .css-1d391kg, .css-12oz5g7 {
-        background-color: #f8f9fa;
-    }
-    
-    /* Estilos personalizados para Tampa Clean - Tema claro */
-    .main-header {
-        font-size: 2.5rem;
-        color: #004085;
-        text-align: center;
-        margin-bottom: 2rem;
-        font-weight: bold;
-        text-shadow: 1px 1px 2px rgba(0, 64, 133, 0.1);
-        border-bottom: 3px solid #007bff;
-        padding-bottom: 1rem;
-    }
-    .subheader {
-        font-size: 1.5rem;
-        color: #004085;
-        margin-bottom: 1rem;
-        font-weight: 600;
-    }
-    .footer {
-        position: fixed;
-        bottom: 0;
-        width: 100%;
-        background-color: #f8f9fa;
-        text-align: center;
-        padding: 10px;
-        font-size: 0.8rem;
-        border-top: 1px solid #dee2e6;
-        color: #6c757d;
-    }
-    /* Estilos para la barra lateral */
-    .sidebar .sidebar-content {
-        background-color: #f8f9fa;
-    }
-    .sidebar .sidebar-content h1, 
-    .sidebar .sidebar-content h2, 
-    .sidebar .sidebar-content h3,
-    .css-1outpf7 {
-        color: #004085 !important;
-    }
-    
-    /* Estilos para los ejemplos de preguntas */
-    .example-questions {
-        background-color: #f8f9fa;
-        padding: 1.5rem;
-        border-radius: 10px;
-        border-left: 4px solid #007bff;
-        margin-bottom: 2rem;
-    }
-    
-    /* Estilos para botones */
-    .stButton > button {
-        background-color: transparent;
-        color: #007bff;
-        border-radius: 5px;
-        border: 2px solid #007bff;
-        padding: 0.5rem 1rem;
-        font-weight: 500;
-    }
-    .stButton > button:hover {
-        background-color: rgba(0, 123, 255, 0.1);
-        color: #0056b3;
-        border-color: #0056b3;
-    }
-    
-    /* Contenedor de mensajes de chat */
-    .stChatMessage {
-        background-color: #ffffff;
-        border: 1px solid #e9ecef;
-        border-radius: 8px;
-        margin-bottom: 1rem;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Estilos y título (HTML estático construido una vez por proceso)
+st.markdown(ui_shell.page_header_html(), unsafe_allow_html=True)
+
+# Endpoint /metrics estilo Prometheus (una sola vez por proceso, si TAMPA_METRICS_PORT está definido)
+@st.cache_resource
+def start_metrics_endpoint(port):
+    return metrics.start_metrics_server(port)
+
+if metrics.METRICS_PORT:
+    start_metrics_endpoint(metrics.METRICS_PORT)
+
+# Respuesta de emergencia cuando el asistente no está disponible
+FALLBACK_ANSWER = """El asistente de Tampa Clean no está disponible en este momento. Por favor intenta de nuevo en unos minutos.
+
+Si tu consulta es urgente, comunícate directamente:
+- 📞 Teléfono: (813) 998-4553
+- 💬 WhatsApp: (813) 365-9970
+- 📧 manager@tampacleaning.org"""
+
+# Mensajes del historial que se muestran inicialmente y cuántos más se añaden con "Mostrar mensajes anteriores"
+CHAT_WINDOW = 20
+CHAT_WINDOW_STEP = 20
 
 # Función para inicializar variables de sesión
 def initialize_session_vars():
@@ -120,17 +59,79 @@ def initialize_session_vars():
         st.session_state.is_configured = False
     if "agent_endpoint" not in st.session_state:
         # Endpoint fijo para Tampa Clean
-        st.session_state.agent_endpoint = "https://e2bveggk4tn4y4gxty7a6ere.agents.do-ai.run"
+        st.session_state.agent_endpoint = agent_client.DEFAULT_AGENT_ENDPOINT
     if "agent_access_key" not in st.session_state:
         st.session_state.agent_access_key = ""
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "pdf_export" not in st.session_state:
+        # Documento PDF incremental de la sesión (se libera si la sesión queda inactiva)
+        st.session_state.pdf_export = {}
+    if "visible_messages" not in st.session_state:
+        st.session_state.visible_messages = CHAT_WINDOW
+    if "client_id" not in st.session_state:
+        # Identificador de la sesión para el límite de consultas y la cola justa
+        st.session_state.client_id = uuid.uuid4().hex
+    if "conversation_id" not in st.session_state:
+        # La conversación se identifica en la URL para sobrevivir a una recarga del navegador
+        st.session_state.conversation_id = st.query_params.get("c") or uuid.uuid4().hex
+        st.session_state.history_loaded = False
+        st.session_state.message_seq = 0
+        st.session_state.has_older_messages = False
 
 # Inicializar variables
 initialize_session_vars()
 
-# Título y descripción de la aplicación
-st.markdown("<h1 class='main-header'>🧽 Asistente Virtual Tampa Clean</h1>", unsafe_allow_html=True)
+# Almacén persistente de conversaciones (compartido por el proceso)
+conversation_store = get_conversation_store()
+
+# Función para recuperar la última página de una conversación guardada
+def load_conversation(conversation_id):
+    # Una conversación guardada con otra clave de acceso (p. ej. un enlace ?c= ajeno) no se abre
+    owner = conversation_store.conversation_owner(conversation_id)
+    if owner is not None and owner != user_key(st.session_state.agent_access_key):
+        start_new_conversation()
+        return
+    page = conversation_store.load_messages(conversation_id)
+    st.session_state.conversation_id = conversation_id
+    st.session_state.messages = page
+    st.session_state.message_seq = conversation_store.last_seq(conversation_id)
+    st.session_state.has_older_messages = bool(page) and conversation_store.has_messages_before(conversation_id, page[0]["seq"])
+    st.session_state.history_loaded = True
+    st.session_state.visible_messages = CHAT_WINDOW
+    st.query_params["c"] = conversation_id
+
+# Función para empezar una conversación nueva (la anterior queda guardada)
+def start_new_conversation():
+    st.session_state.conversation_id = uuid.uuid4().hex
+    st.session_state.messages = []
+    st.session_state.message_seq = 0
+    st.session_state.has_older_messages = False
+    st.session_state.history_loaded = True
+    st.session_state.visible_messages = CHAT_WINDOW
+    st.query_params["c"] = st.session_state.conversation_id
+
+# Función para añadir un mensaje al historial y guardarlo en segundo plano
+def add_message(role, content, error=False):
+    st.session_state.message_seq += 1
+    st.session_state.messages.append(ChatMessage(role, content, st.session_state.message_seq, error))
+    conversation_store.save_message(
+        st.session_state.conversation_id,
+        user_key(st.session_state.agent_access_key),
+        st.session_state.message_seq,
+        role,
+        content,
+        is_error=error
+    )
+
+# Función para registrar el tiempo de render: el primero de la sesión ("startup") y los siguientes ("rerun")
+def record_render_time():
+    elapsed = time.perf_counter() - script_start
+    if "first_render_ms" not in st.session_state:
+        st.session_state.first_render_ms = elapsed * 1000
+        metrics.registry.record("startup", total=elapsed)
+    else:
+        metrics.registry.record("rerun", total=elapsed)
 
 # Pantalla de configuración inicial si aún no se ha configurado
 if not st.session_state.is_configured:
@@ -158,57 +159,22 @@ if not st.session_state.is_configured:
             st.rerun()
     
     # Parar ejecución hasta que se configure
+    record_render_time()
     st.stop()
 
-# Una vez configurado, mostrar la interfaz normal
-st.markdown("<p class='subheader'>💬 Chatea con tu asistente virtual de Tampa Clean</p>", unsafe_allow_html=True)
+# Memoria de las sesiones del proceso: si esta sesión se liberó por inactividad, su historial se vació.
+# Se marca activa ya aquí para que no se libere mientras dura esta ejecución.
+session_registry = get_session_registry()
+session_registered = session_registry.begin(st.session_state.client_id)
+if not session_registered:
+    st.session_state.history_loaded = False
 
-# Agregar ejemplos de preguntas específicos para Tampa Clean en dos columnas
-st.markdown("""
-<div class="example-questions">
-    <p style="font-size: 1.1rem; color: #004085; margin-bottom: 1.5rem; font-weight: 600; font-family: 'Segoe UI', Arial, sans-serif; text-align: center;">
-        💡 Ejemplos de preguntas que puedes hacer:
-    </p>
-</div>
-""", unsafe_allow_html=True)
+# Recuperar la conversación guardada (tras recargar el navegador, reiniciar, volver a iniciar sesión o liberar la sesión)
+if not st.session_state.history_loaded:
+    load_conversation(st.session_state.conversation_id)
 
-col1, col2 = st.columns(2)
-
-with col1:
-    st.markdown("""
-    <div style="background-color: rgba(0, 123, 255, 0.08); padding: 1rem; border-radius: 8px; border-left: 3px solid #007bff; margin-bottom: 1rem;">
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">🏠 ¿Qué servicios de limpieza residencial ofrecen?</span>
-        </div>
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">🏢 ¿Cómo funciona la limpieza comercial de oficinas?</span>
-        </div>
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">👔 ¿Cuáles son las políticas para empleados nuevos?</span>
-        </div>
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">🧽 ¿Qué productos de limpieza debo usar para baños?</span>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-
-with col2:
-    st.markdown("""
-    <div style="background-color: rgba(0, 123, 255, 0.08); padding: 1rem; border-radius: 8px; border-left: 3px solid #007bff; margin-bottom: 1rem;">
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">💰 ¿Cómo funcionan los pagos y cuándo se realizan?</span>
-        </div>
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">📞 ¿Cuáles son los números de contacto de emergencia?</span>
-        </div>
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">🕐 ¿Cómo solicito permisos y días libres?</span>
-        </div>
-        <div style="margin-bottom: 0.8rem; padding: 0.5rem; background-color: rgba(0, 123, 255, 0.05); border-radius: 4px;">
-            <span style="font-weight: 500; color: #004085;">🚨 ¿Qué hacer en caso de emergencias durante el servicio?</span>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+# Una vez configurado, mostrar la interfaz normal con ejemplos de preguntas específicos para Tampa Clean
+st.markdown(ui_shell.examples_html(), unsafe_allow_html=True)
 
 # Sidebar para configuración
 st.sidebar.title("⚙️ Configuración Tampa Clean")
@@ -238,72 +204,119 @@ with st.sidebar.expander("🔧 Ajustes avanzados"):
     
     max_tokens = st.slider("📏 Longitud máxima", min_value=100, max_value=2000, value=1000, step=100,
                           help="Número máximo de tokens en la respuesta.")
+    
+    context_budget = st.slider("🧠 Memoria de contexto (tokens)", min_value=200, max_value=4000,
+                               value=context_window.DEFAULT_CONTEXT_BUDGET, step=100,
+                               help="Tokens máximos del historial que se envía al asistente. Los turnos más antiguos se resumen.")
+    
+    use_streaming = st.toggle("⚡ Respuestas en streaming", value=True,
+                              help="Muestra la respuesta a medida que se genera en lugar de esperar a que esté completa.")
+    
+    voice_answers = st.toggle("🔊 Respuestas por voz", value=False,
+                              help="Lee en voz alta las respuestas del asistente. Las frases se sintetizan mientras llega la respuesta "
+                                   "y el audio se reproduce cuando la respuesta está completa.")
+    
+    kb_threshold = st.slider("📚 Confianza de respuestas rápidas", min_value=0.5, max_value=1.0,
+                             value=KB_THRESHOLD, step=0.05,
+                             help="Confianza mínima para responder desde la base de conocimiento local sin consultar al asistente.")
+    
+    # Tamaño del contexto enviado en la última consulta
+    if st.session_state.get("last_context_tokens") is not None:
+        st.caption(f"🧠 Contexto enviado: ~{st.session_state.last_context_tokens} tokens")
+    
+    # Tiempo hasta el primer token de la última respuesta en streaming
+    if st.session_state.get("last_ttft") is not None:
+        st.caption(f"⏱️ Primer token en {st.session_state.last_ttft:.2f} s")
+    
+    # Tiempo del primer render de la sesión
+    if st.session_state.get("first_render_ms") is not None:
+        st.caption(f"🚀 Primera carga en {st.session_state.first_render_ms:.0f} ms")
+
+# Estadísticas de la caché de respuestas compartida
+response_cache = get_response_cache()
+# Precarga de las preguntas siguientes más probables (una por proceso, aprende del almacén)
+prefetcher = get_prefetcher() if PREFETCH_ENABLED else None
+with st.sidebar.expander("📦 Caché de respuestas"):
+    cache_stats = response_cache.stats()
+    st.markdown(f"""
+    - ✅ Aciertos: **{cache_stats['hits']}** (similares: {cache_stats['near_hits']})
+    - ❌ Fallos: **{cache_stats['misses']}**
+    - 📈 Tasa de aciertos: **{cache_stats['hit_rate']:.0%}**
+    - 🗂️ Respuestas guardadas: **{cache_stats['entries']}**
+    """)
+    if prefetcher is not None:
+        prefetch_stats = prefetcher.stats()
+        st.caption(f"🔮 Precargadas: {prefetch_stats['issued']} (usadas: {prefetch_stats['used']}) · "
+                   f"tope: {prefetch_stats['budget']:.0%} de las consultas reales")
+    if st.button("🧹 Vaciar caché"):
+        response_cache.clear()
+        st.rerun()
+
+# Base de conocimiento local (preguntas frecuentes y políticas, cargada una vez por proceso)
+knowledge_base = get_knowledge_base()
+with st.sidebar.expander("📚 Respuestas rápidas"):
+    kb_stats = knowledge_base.stats()
+    st.markdown(f"""
+    - 🗂️ Temas en la base de conocimiento: **{kb_stats['entries']}**
+    - 🎯 Respondidas localmente: **{kb_stats['matches']}** de {kb_stats['lookups']} (**{kb_stats['match_rate']:.0%}**)
+    - ⚡ Búsqueda media: **{kb_stats['avg_ms']:.2f} ms**
+    """)
 
-# Sección para probar conexión con el agente
-with st.sidebar.expander("🔍 Probar conexión"):
-    if st.button("🌐 Verificar endpoint"):
-        with st.spinner("Verificando conexión..."):
-            try:
-                agent_endpoint = st.session_state.agent_endpoint
-                agent_access_key = st.session_state.agent_access_key
-                
-                if not agent_endpoint or not agent_access_key:
-                    st.error("❌ Falta configuración del endpoint o clave de acceso")
-                else:
-                    # Asegurarse de que el endpoint termine correctamente
-                    if not agent_endpoint.endswith("/"):
-                        agent_endpoint += "/"
-                    
-                    # Verificar si la documentación está disponible
-                    docs_url = f"{agent_endpoint}docs"
-                    
-                    # Preparar headers
-                    headers = {
-                        "Authorization": f"Bearer {agent_access_key}",
-                        "Content-Type": "application/json"
-                    }
-                    
-                    try:
-                        # Intentar verificar documentación
-                        response = requests.get(docs_url, timeout=10)
-                        
-                        if response.status_code < 400:
-                            st.success(f"✅ Documentación accesible: {docs_url}")
-                        
-                        # Intentar solicitud de prueba
-                        completions_url = f"{agent_endpoint}api/v1/chat/completions"
-                        test_payload = {
-                            "model": "n/a",
-                            "messages": [{"role": "user", "content": "Hello Tampa Clean"}],
-                            "max_tokens": 5,
-                            "stream": False
-                        }
-                        
-                        response = requests.post(completions_url, headers=headers, json=test_payload, timeout=10)
-                        
-                        if response.status_code < 400:
-                            st.success(f"✅ ¡Conexión exitosa con Tampa Clean!")
-                            with st.expander("📄 Ver detalles de la respuesta"):
-                                try:
-                                    st.json(response.json())
-                                except:
-                                    st.code(response.text)
-                            st.info("🔍 El asistente de Tampa Clean está listo para atender consultas.")
-                        else:
-                            st.error(f"❌ Error al conectar. Código: {response.status_code}")
-                            with st.expander("📄 Ver detalles del error"):
-                                st.code(response.text)
-                    except Exception as e:
-                        st.error(f"❌ Error de conexión: {str(e)}")
-            except Exception as e:
-                st.error(f"❌ Error al verificar endpoint: {str(e)}")
+# Límite de consultas por sesión y cola justa delante del asistente (compartidos por el proceso)
+rate_limiter = get_rate_limiter()
+request_scheduler = get_scheduler()
+with st.sidebar.expander("🚦 Cola de solicitudes"):
+    queue_stats = request_scheduler.stats()
+    wait_p50 = queue_stats["wait_p50"] or 0.0
+    wait_p95 = queue_stats["wait_p95"] or 0.0
+    st.markdown(f"""
+    - ⚙️ En curso: **{queue_stats['active']}** de {queue_stats['slots']}
+    - 💬 En cola (chat): **{queue_stats['queued']['interactive']}**
+    - 🕒 En cola (segundo plano): **{queue_stats['queued']['background']}**
+    - ⏳ Espera en cola: p50 **{wait_p50:.2f} s** · p95 **{wait_p95:.2f} s**
+    - 🎟️ Consultas disponibles para ti: **{rate_limiter.remaining(st.session_state.client_id)}** de {rate_limiter.burst}
+    """)
+    if st.session_state.get("last_queue_wait"):
+        st.caption(f"Tu última consulta esperó {st.session_state.last_queue_wait:.2f} s en la cola")
+
+# Estado del asistente: el monitor comprueba el endpoint en segundo plano (una vez por proceso)
+# y aquí solo se lee el último resultado, sin esperar a la red
+resilient_caller = get_resilient_caller()
+health_monitor = get_health_monitor(st.session_state.agent_endpoint)
+with st.sidebar.expander("🩺 Estado del asistente"):
+    health = health_monitor.status()
+    st.markdown(f"{STATE_ICONS[health['state']]} Asistente **{health['state']}**")
+    if health["checks"]:
+        latency = "sin respuestas correctas"
+        if health["latency_p50"] is not None:
+            latency = f"p50 **{health['latency_p50'] * 1000:.0f} ms** · p95 **{health['latency_p95'] * 1000:.0f} ms**"
+        st.markdown(f"""
+        - 📈 Disponibilidad: **{health['availability']:.0%}** (últimas {health['checks']} comprobaciones)
+        - ⏱️ Latencia: {latency}
+        - 🔁 Última comprobación: hace {max(0, time.time() - health['last_checked']):.0f} s (respuesta: {health['last_status']})
+        """)
+    else:
+        st.caption("Primera comprobación en curso...")
+    
+    breaker_state = resilient_caller.breaker.snapshot()
+    if breaker_state["state"] == CircuitBreaker.OPEN:
+        st.warning(f"🔴 Circuito abierto: el asistente no responde. Reintento en {breaker_state['retry_in']:.0f} s")
+    elif breaker_state["state"] == CircuitBreaker.HALF_OPEN:
+        st.info("🟡 Circuito semiabierto: probando la conexión con el asistente")
+    else:
+        st.caption(f"🟢 Circuito cerrado · fallos seguidos: {breaker_state['failures']}")
+    
+    # La comprobación se hace en segundo plano; el resultado aparece en el siguiente rerun
+    if st.button("🔄 Comprobar ahora"):
+        health_monitor.check_now()
+        st.toast("🩺 Comprobación solicitada")
 
 # Opciones de gestión de conversación
 st.sidebar.markdown("### 💬 Gestión de conversación")
 
 # Botón para limpiar conversación
 if st.sidebar.button("🗑️ Limpiar conversación"):
-    st.session_state.messages = []
+    start_new_conversation()
     st.rerun()
 
 # Botón para guardar conversación en PDF
@@ -311,61 +324,39 @@ if st.sidebar.button("💾 Guardar conversación en PDF"):
     if len(st.session_state.messages) == 0:
         st.sidebar.warning("⚠️ No hay conversación para guardar")
     else:
-        # Crear PDF
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        
-        # Añadir título con estilo Tampa Clean
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(200, 10, "Conversacion con Asistente Tampa Clean", ln=True, align='C')
-        pdf.ln(10)
-        
-        # Añadir información de la empresa
-        pdf.set_font("Arial", 'I', 10)
-        pdf.cell(200, 5, "Tampa Clean - Servicios de Limpieza Profesional", ln=True, align='C')
-        pdf.cell(200, 5, "Telefono: (813) 998-4553 | WhatsApp: (813) 365-9970", ln=True, align='C')
-        pdf.ln(5)
-        
-        # Añadir fecha
-        from datetime import datetime
-        pdf.cell(200, 10, f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", ln=True)
-        pdf.ln(10)
-        
-        # Recuperar mensajes
-        pdf.set_font("Arial", size=12)
-        for i, msg in enumerate(st.session_state.messages, 1):
-            if msg["role"] == "user":
-                pdf.set_text_color(0, 100, 0)  # Verde para usuario
-                pdf.cell(200, 10, f"Usuario (#{i}):", ln=True)
-            else:
-                pdf.set_text_color(0, 0, 150)  # Azul para asistente
-                pdf.cell(200, 10, f"Asistente Tampa Clean (#{i}):", ln=True)
-            
-            pdf.set_text_color(0, 0, 0)  # Negro para el contenido
-            
-            # Partir el texto en múltiples líneas si es necesario
-            text = msg["content"]
-            pdf.multi_cell(190, 8, text.encode('latin-1', 'replace').decode('latin-1'))
-            pdf.ln(5)
-        
-        # Guardar el PDF en un archivo temporal
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            pdf_path = tmp_file.name
-            pdf.output(pdf_path)
-        
-        # Abrir y leer el archivo para la descarga
-        with open(pdf_path, "rb") as f:
-            pdf_data = f.read()
+        # Generar el PDF en memoria (solo se dibujan los mensajes nuevos desde la última exportación)
+        # fpdf se importa solo al exportar por primera vez
+        from pdf_export import export_conversation_pdf
+        export_messages = st.session_state.messages
+        if st.session_state.has_older_messages:
+            # Los mensajes antiguos no están en memoria: exportar la conversación completa desde el almacén
+            conversation_store.flush()
+            export_messages = conversation_store.load_messages(st.session_state.conversation_id, limit=-1)
+        pdf_data = export_conversation_pdf(export_messages, st.session_state.pdf_export)
         
         # Botón de descarga
         st.sidebar.download_button(
             label="📥 Descargar PDF",
             data=pdf_data,
-            file_name=f"conversacion_tampa_clean_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+            file_name=f"conversacion_tampa_clean_{time.strftime('%Y%m%d_%H%M%S')}.pdf",
             mime="application/pdf",
         )
 
+# Búsqueda en conversaciones anteriores
+with st.sidebar.expander("🔎 Buscar en conversaciones"):
+    search_text = st.text_input("Buscar", placeholder="p. ej. permisos, pagos, productos", label_visibility="collapsed")
+    if search_text:
+        search_start = time.perf_counter()
+        # Solo las conversaciones guardadas con esta clave de acceso (compartida: no separa personas)
+        results = conversation_store.search(search_text, owner=user_key(st.session_state.agent_access_key))
+        st.caption(f"{len(results)} resultados en {(time.perf_counter() - search_start) * 1000:.0f} ms")
+        for i, result in enumerate(results):
+            role_label = "👤 Usuario" if result["role"] == "user" else "🧽 Asistente"
+            st.markdown(f"{role_label} · {time.strftime('%d/%m/%Y %H:%M', time.localtime(result['created_at']))}\n\n{result['snippet']}")
+            if st.button("📂 Abrir conversación", key=f"open_conversation_{i}"):
+                load_conversation(result["conversation_id"])
+                st.rerun()
+
 # Botón para cerrar sesión
 if st.sidebar.button("🚪 Cerrar sesión"):
     st.session_state.is_configured = False
@@ -373,128 +364,223 @@ if st.sidebar.button("🚪 Cerrar sesión"):
     # El endpoint permanece fijo, no se limpia
     st.rerun()
 
-# Función para enviar consulta al agente
+# Función para enviar consulta al agente (turno en la cola justa y luego el despachador compartido)
 def query_agent(prompt, history=None):
     try:
-        # Obtener configuración del agente
-        agent_endpoint = st.session_state.agent_endpoint
-        agent_access_key = st.session_state.agent_access_key
-        
-        if not agent_endpoint or not agent_access_key:
-            return {"error": "Las credenciales de API no están configuradas correctamente."}
-        
-        # Asegurarse de que el endpoint termine correctamente
-        if not agent_endpoint.endswith("/"):
-            agent_endpoint += "/"
-        
-        # Construir URL para chat completions
-        completions_url = f"{agent_endpoint}api/v1/chat/completions"
-        
-        # Preparar headers con autenticación
-        headers = {
-            "Authorization": f"Bearer {agent_access_key}",
-            "Content-Type": "application/json"
-        }
-        
-        # Preparar los mensajes en formato OpenAI
-        messages = []
-        if history:
-            messages.extend([{"role": msg["role"], "content": msg["content"]} for msg in history])
-        messages.append({"role": "user", "content": prompt})
-        
-        # Construir el payload
-        payload = {
-            "model": "n/a",  # El modelo no es relevante para el agente
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "stream": False
-        }
-        
-        # Enviar solicitud POST
-        try:
-            response = requests.post(completions_url, headers=headers, json=payload, timeout=60)
-            
-            # Verificar respuesta
-            if response.status_code == 200:
-                try:
-                    response_data = response.json()
-                    
-                    # Procesar la respuesta en formato OpenAI
-                    if "choices" in response_data and len(response_data["choices"]) > 0:
-                        choice = response_data["choices"][0]
-                        if "message" in choice and "content" in choice["message"]:
-                            result = {
-                                "response": choice["message"]["content"]
-                            }
-                            return result
-                    
-                    # Si no se encuentra la estructura esperada
-                    return {"error": "Formato de respuesta inesperado", "details": str(response_data)}
-                except ValueError:
-                    # Si no es JSON, devolver el texto plano
-                    return {"response": response.text}
-            else:
-                # Error en la respuesta
-                error_message = f"Error en la solicitud. Código: {response.status_code}"
-                try:
-                    error_details = response.json()
-                    return {"error": error_message, "details": str(error_details)}
-                except:
-                    return {"error": error_message, "details": response.text}
-                
-        except requests.exceptions.RequestException as e:
-            return {"error": f"Error en la solicitud HTTP: {str(e)}"}
-        
-    except Exception as e:
-        return {"error": f"Error al comunicarse con el asistente: {str(e)}"}
+        with request_scheduler.slot(st.session_state.client_id, PRIORITY_INTERACTIVE) as queue_wait:
+            st.session_state.last_queue_wait = queue_wait
+            return get_dispatcher().query(
+                st.session_state.agent_endpoint,
+                st.session_state.agent_access_key,
+                prompt,
+                history,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+    except QueueTimeout as e:
+        return {"error": str(e)}
+
+# Función para recibir la respuesta del agente token a token (SSE); el turno en la cola dura todo el stream
+def stream_agent_response(prompt, history=None, result=None):
+    if result is None:
+        result = {}
+    try:
+        with request_scheduler.slot(st.session_state.client_id, PRIORITY_INTERACTIVE) as queue_wait:
+            st.session_state.last_queue_wait = queue_wait
+            yield from get_dispatcher().stream(
+                st.session_state.agent_endpoint,
+                st.session_state.agent_access_key,
+                prompt,
+                history,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                result=result
+            )
+    except QueueTimeout as e:
+        result["error"] = str(e)
+
+# Pasar el texto al sintetizador de voz a medida que llega: las primeras frases se sintetizan
+# mientras el asistente sigue generando la respuesta
+def speak_while_streaming(chunks, speech_job):
+    for chunk in chunks:
+        speech_job.feed(chunk)
+        yield chunk
+
+# Reproducir la respuesta hablada (el audio se sintetiza en segundo plano, frase a frase).
+# Se reproduce como un único audio: Streamlit no permite encadenar reproductores (varios
+# st.audio con autoplay suenan a la vez y sustituir uno reinicia la reproducción).
+def play_voice_answer(speech_job):
+    with st.spinner("🔊 Generando audio..."):
+        audio = speech_job.audio()
+    if audio is None:
+        st.caption(f"🔇 No se pudo generar el audio: {speech_job.error}")
+    else:
+        st.audio(audio, format=speech_job.synthesizer.engine.mime, autoplay=True)
 
-# Mostrar historial de conversación
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Mostrar historial de conversación: solo la ventana de mensajes más recientes.
+# Al ser un fragmento, "Mostrar mensajes anteriores" vuelve a dibujar solo el historial
+# y no toda la página; en los demás reruns el coste queda acotado por el tamaño de la ventana.
+@st.fragment
+def render_chat_history():
+    messages = st.session_state.messages
+    hidden = max(0, len(messages) - st.session_state.visible_messages)
+    
+    if hidden or st.session_state.has_older_messages:
+        if st.button("⬆️ Mostrar mensajes anteriores", key="show_older_messages"):
+            if not hidden and messages:
+                # Todos los mensajes cargados ya están visibles: traer la página anterior del almacén
+                older = conversation_store.load_messages(st.session_state.conversation_id, before_seq=messages[0]["seq"])
+                st.session_state.messages = older + messages
+                st.session_state.has_older_messages = bool(older) and conversation_store.has_messages_before(st.session_state.conversation_id, older[0]["seq"])
+                messages = st.session_state.messages
+            st.session_state.visible_messages += CHAT_WINDOW_STEP
+            hidden = max(0, len(messages) - st.session_state.visible_messages)
+        if hidden:
+            st.caption(f"{hidden} mensajes anteriores ocultos")
+    
+    for message in messages[hidden:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            # Audio de la última respuesta hablada (solo desde la caché, sin volver a sintetizar)
+            if voice_answers and message["seq"] == st.session_state.get("voice_seq"):
+                speech_synthesizer = get_speech_synthesizer()
+                audio = speech_synthesizer.cached_audio(message["content"])
+                if audio is not None:
+                    st.audio(audio, format=speech_synthesizer.engine.mime)
+
+render_chat_history()
 
 # Campo de entrada para el mensaje
 prompt = st.chat_input("💬 Pregúntame sobre Tampa Clean - servicios, políticas, procedimientos...")
 
+# La página ya es interactiva (la consulta se mide aparte como "turn")
+record_render_time()
+
 # Procesar la entrada del usuario
 if prompt:
     # Añadir mensaje del usuario al historial
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    add_message("user", prompt)
     
     # Mostrar mensaje del usuario
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    # Preparar historial para la API
-    api_history = st.session_state.messages[:-1]  # Excluir el mensaje actual
+    # Preparar historial para la API: turnos recientes dentro del presupuesto de tokens
+    api_history, st.session_state.last_context_tokens = context_window.pack_history(
+        st.session_state.messages[:-1],  # Excluir el mensaje actual
+        context_budget
+    )
+    
+    # Buscar primero en la base de conocimiento local y después en la caché de respuestas
+    # (la clave incluye el historial: una respuesta nunca se sirve en otro contexto)
+    turn_start = time.perf_counter()
+    knowledge_base_match = knowledge_base.lookup(prompt, kb_threshold)
+    if knowledge_base_match is not None:
+        cached_response = knowledge_base_match["answer"]
+    else:
+        cached_response = response_cache.get(prompt, temperature, max_tokens, api_history)
+    
+    # Las respuestas locales no cuentan para el límite de consultas por sesión
+    retry_after = 0.0 if cached_response is not None else rate_limiter.acquire(st.session_state.client_id)
+    
+    if prefetcher is not None:
+        if cached_response is None and not retry_after:
+            # Consulta real al asistente: da margen a la precarga
+            prefetcher.record_request()
+        elif knowledge_base_match is None and cached_response is not None:
+            prefetcher.note_cache_hit(prompt)
+    
+    # Respuesta por voz: la síntesis empieza en segundo plano en cuanto hay frases completas
+    speech_job = get_speech_synthesizer().start() if voice_answers else None
     
-    # Mostrar indicador de carga mientras se procesa
     with st.chat_message("assistant"):
-        with st.spinner("🔍 Consultando base de conocimiento de Tampa Clean..."):
-            # Enviar consulta al agente
-            response = query_agent(prompt, api_history)
+        if cached_response is not None:
+            response = {"response": cached_response, "cached": True}
+        elif retry_after:
+            response = {"error": f"Has enviado demasiadas consultas seguidas. Espera {math.ceil(retry_after)} s e inténtalo de nuevo."}
+        elif use_streaming:
+            # Mostrar los tokens a medida que llegan
+            response = {}
+            agent_stream = stream_agent_response(prompt, api_history, response)
+            if speech_job is not None:
+                agent_stream = speak_while_streaming(agent_stream, speech_job)
+            streamed_text = st.write_stream(agent_stream)
+            if "ttft" in response:
+                st.session_state.last_ttft = response["ttft"]
+            if "error" not in response and isinstance(streamed_text, str) and streamed_text:
+                response["response"] = streamed_text
+        else:
+            # Mostrar indicador de carga mientras se procesa
+            with st.spinner("🔍 Consultando base de conocimiento de Tampa Clean..."):
+                # Enviar consulta al agente
+                response = query_agent(prompt, api_history)
+        
+        # Circuito abierto: responder al instante con una respuesta guardada a una pregunta casi
+        # idéntica (la base de conocimiento ya se consultó) o con la respuesta de emergencia
+        if response.get("circuit_open"):
+            fallback_text = response_cache.closest(prompt, history=api_history)
+            if fallback_text is None:
+                fallback_text = FALLBACK_ANSWER
+            st.warning(f"⚠️ {response['error']}")
+            response = {"response": fallback_text, "cached": True, "fallback": True}
+        
+        # Registrar la latencia del turno completo tal como la percibe el usuario
+        metrics.registry.record(
+            "turn",
+            total=time.perf_counter() - turn_start,
+            ttft=response.get("ttft"),
+            cache_hit=bool(response.get("cached")) and not response.get("fallback"),
+            error=response.get("error")
+        )
+        
+        if "error" in response:
+            st.error(f"❌ Error: {response['error']}")
+            if "details" in response:
+                with st.expander("📋 Detalles del error"):
+                    st.code(response["details"])
             
-            if "error" in response:
-                st.error(f"❌ Error: {response['error']}")
-                if "details" in response:
-                    with st.expander("📋 Detalles del error"):
-                        st.code(response["details"])
-                
-                # Añadir mensaje de error al historial
-                error_msg = f"Lo siento, ocurrió un error al procesar tu consulta sobre Tampa Clean: {response['error']}"
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
-            else:
-                # Mostrar respuesta del asistente
-                response_text = response.get("response", "No se recibió respuesta del asistente de Tampa Clean.")
+            # Añadir mensaje de error al historial
+            error_msg = f"{context_window.ERROR_MESSAGE_PREFIX} sobre Tampa Clean: {response['error']}"
+            add_message("assistant", error_msg, error=True)
+        else:
+            # Mostrar respuesta del asistente (en streaming ya se mostró)
+            response_text = response.get("response", "No se recibió respuesta del asistente de Tampa Clean.")
+            if not use_streaming or "response" not in response or response.get("cached"):
                 st.markdown(response_text)
-                
-                # Añadir respuesta al historial
-                st.session_state.messages.append({"role": "assistant", "content": response_text})
+                if speech_job is not None:
+                    speech_job.feed(response_text)
+            if knowledge_base_match is not None:
+                st.caption(f"📚 Base de conocimiento · confianza {knowledge_base_match['confidence']:.0%} · "
+                           f"{knowledge_base_match['elapsed'] * 1000:.2f} ms")
+            
+            # Guardar en caché las respuestas a preguntas sin contexto previo (p. ej. preguntas frecuentes)
+            if "response" in response and not response.get("cached") and not api_history:
+                response_cache.put(prompt, temperature, max_tokens, response_text)
+            
+            # Añadir respuesta al historial (las respuestas de emergencia no se envían como contexto)
+            if response.get("fallback"):
+                add_message("assistant", response_text, error=True)
+            else:
+                add_message("assistant", response_text)
+                # Mientras el usuario lee, precargar en segundo plano las preguntas que suelen venir después
+                if prefetcher is not None:
+                    next_history, _ = context_window.pack_history(st.session_state.messages, context_budget)
+                    prefetcher.schedule(prompt, next_history, st.session_state.agent_endpoint,
+                                        st.session_state.agent_access_key, temperature, max_tokens)
+            
+            if speech_job is not None:
+                play_voice_answer(speech_job.finish())
+                st.session_state.voice_seq = st.session_state.message_seq
 
 # Pie de página
-st.markdown("""
-<div class='footer'>
-    🧽 Asistente Tampa Clean © 2025 | 📞 (813) 998-4553 | 💬 WhatsApp: (813) 365-9970 | 📧 manager@tampacleaning.org
-</div>
-""", unsafe_allow_html=True)
+st.markdown(ui_shell.footer_html(), unsafe_allow_html=True)
+
+# Acotar la memoria de la sesión: los mensajes antiguos quedan solo en el almacén de conversaciones
+trimmed = trim_messages(st.session_state.messages, max(SESSION_MAX_MESSAGES, st.session_state.visible_messages))
+if trimmed:
+    st.session_state.has_older_messages = True
+still_registered = session_registry.touch(st.session_state.client_id, st.session_state.messages,
+                                          st.session_state.pdf_export, trimmed)
+if session_registered and not still_registered:
+    # La sesión se liberó durante la ejecución (su historial en memoria se vació): recargarlo del almacén
+    st.session_state.history_loaded = False
@@ -0,0 +1,298 @@
+import os
+import time
+
+import requests
+import streamlit as st
+
+import metrics
+import wire_format
+
+# Tamaños del pool de conexiones (configurables por variables de entorno)
+HTTP_POOL_CONNECTIONS = int(os.environ.get("TAMPA_HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("TAMPA_HTTP_POOL_MAXSIZE", "32"))
+
+# Endpoint fijo del asistente de Tampa Clean
+DEFAULT_AGENT_ENDPOINT = "https://e2bveggk4tn4y4gxty7a6ere.agents.do-ai.run"
+
+# Tiempos máximos de espera (segundos)
+COMPLETION_TIMEOUT = 60
+PROBE_TIMEOUT = 10
+
+
+# Cliente HTTP con pool de conexiones (también para scripts fuera de Streamlit)
+def create_http_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+    session = requests.Session()
+    # El adaptador mide DNS, conexión y TLS de cada conexión nueva
+    adapter = metrics.TimedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+# Cliente HTTP compartido por todas las sesiones del proceso.
+# Reutiliza las conexiones TCP/TLS (keep-alive) entre reruns y entre usuarios.
+@st.cache_resource
+def get_http_session(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+    return create_http_session(pool_connections, pool_maxsize)
+
+
+# Asegurarse de que el endpoint termine correctamente
+def normalize_endpoint(agent_endpoint):
+    if not agent_endpoint.endswith("/"):
+        agent_endpoint += "/"
+    return agent_endpoint
+
+
+def build_completions_url(agent_endpoint):
+    return f"{normalize_endpoint(agent_endpoint)}api/v1/chat/completions"
+
+
+# Preparar headers con autenticación
+def build_headers(agent_access_key, stream=False, content_encoding=None):
+    headers = {
+        "Authorization": f"Bearer {agent_access_key}",
+        "Content-Type": "application/json"
+    }
+    if stream:
+        headers["Accept"] = "text/event-stream"
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return headers
+
+
+# Preparar los mensajes en formato OpenAI: solo rol y contenido, sin espacios sobrantes
+# y sin mensajes vacíos (no aportan contexto y ocupan bytes en cada turno)
+def build_messages(prompt, history=None):
+    messages = []
+    if history:
+        for msg in history:
+            content = msg["content"].strip()
+            if content:
+                messages.append({"role": msg["role"], "content": content})
+    messages.append({"role": "user", "content": prompt.strip()})
+    return messages
+
+
+# Construir el payload ("stream" solo se envía cuando se pide streaming; por defecto es falso)
+def build_payload(prompt, history, temperature, max_tokens, stream=False):
+    payload = {
+        "model": "n/a",  # El modelo no es relevante para el agente
+        "messages": build_messages(prompt, history),
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+# Enviar el payload como JSON compacto, comprimido si el endpoint lo admite. Si el endpoint
+# rechaza el cuerpo comprimido, se reenvía sin comprimir y no se vuelve a comprimir para él.
+def post_payload(session, url, agent_access_key, payload, stream=False):
+    body, encoding = wire_format.encode_request(payload, url)
+    response = session.post(url, headers=build_headers(agent_access_key, stream, encoding), data=body,
+                            timeout=COMPLETION_TIMEOUT, stream=stream)
+    # Solo se lee el cuerpo de los 400 (mensaje de error corto); el resto se deja para el streaming
+    if encoding and wire_format.compression_rejected(response.status_code,
+                                                     response.content if response.status_code == 400 else b""):
+        response.close()
+        wire_format.negotiator.reject(url, encoding)
+        response = session.post(url, headers=build_headers(agent_access_key, stream), data=wire_format.dumps(payload),
+                                timeout=COMPLETION_TIMEOUT, stream=stream)
+    wire_format.negotiator.observe(url, response.headers)
+    return response
+
+
+# Interpretar la respuesta de chat/completions: devuelve (resultado, uso de tokens)
+def parse_completion_response(response):
+    # Verificar respuesta
+    if response.status_code == 200:
+        try:
+            response_data = wire_format.loads(response.content)
+
+            # Procesar la respuesta en formato OpenAI
+            if "choices" in response_data and len(response_data["choices"]) > 0:
+                choice = response_data["choices"][0]
+                if "message" in choice and "content" in choice["message"]:
+                    result = {
+                        "response": choice["message"]["content"]
+                    }
+                    return result, response_data.get("usage")
+
+            # Si no se encuentra la estructura esperada
+            return {"error": "Formato de respuesta inesperado", "details": str(response_data)}, None
+        except ValueError:
+            # Si no es JSON, devolver el texto plano
+            return {"response": response.text}, None
+    else:
+        # Error en la respuesta
+        error_message = f"Error en la solicitud. Código: {response.status_code}"
+        try:
+            error_details = wire_format.loads(response.content)
+            return {"error": error_message, "details": str(error_details), "status_code": response.status_code}, None
+        except:
+            return {"error": error_message, "details": response.text, "status_code": response.status_code}, None
+
+
+# Registrar duración, tamaños y tokens de una respuesta HTTP
+def record_response_metrics(kind, response, start_time, usage=None, error=None, response_bytes=None, ttft=None):
+    usage = usage or {}
+    metrics.registry.record(
+        kind,
+        status=response.status_code,
+        total=time.perf_counter() - start_time,
+        ttfb=response.elapsed.total_seconds(),
+        ttft=ttft,
+        request_bytes=len(response.request.body or b""),
+        response_bytes=len(response.content) if response_bytes is None else response_bytes,
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        error=error,
+        **metrics.pop_connection_timings()
+    )
+
+
+# Enviar una consulta al agente y devolver {"response": ...} o {"error": ..., "details": ...}.
+# "session" permite a los hilos en segundo plano usar el cliente compartido sin pasar por Streamlit.
+def request_completion(agent_endpoint, agent_access_key, prompt, history=None, temperature=0.2, max_tokens=1000, session=None):
+    try:
+        if not agent_endpoint or not agent_access_key:
+            return {"error": "Las credenciales de API no están configuradas correctamente."}
+
+        completions_url = build_completions_url(agent_endpoint)
+        payload = build_payload(prompt, history, temperature, max_tokens)
+
+        # Enviar solicitud POST
+        metrics.reset_connection_timings()
+        start_time = time.perf_counter()
+        try:
+            response = post_payload(session or get_http_session(), completions_url, agent_access_key, payload)
+        except requests.exceptions.RequestException as e:
+            metrics.registry.record("chat", total=time.perf_counter() - start_time, error=str(e), **metrics.pop_connection_timings())
+            # Fallo de transporte (timeout, conexión): se puede reintentar
+            return {"error": f"Error en la solicitud HTTP: {str(e)}", "transient": True}
+
+        result, usage = parse_completion_response(response)
+        record_response_metrics("chat", response, start_time, usage, error=result.get("error"))
+        return result
+
+    except Exception as e:
+        return {"error": f"Error al comunicarse con el asistente: {str(e)}"}
+
+
+# Recibir la respuesta del agente token a token (SSE).
+# "result" se rellena con el error (si lo hay) y el tiempo hasta el primer token.
+def stream_completion(agent_endpoint, agent_access_key, prompt, history=None, temperature=0.2, max_tokens=1000, result=None, session=None):
+    if result is None:
+        result = {}
+
+    if not agent_endpoint or not agent_access_key:
+        result["error"] = "Las credenciales de API no están configuradas correctamente."
+        return
+
+    completions_url = build_completions_url(agent_endpoint)
+    payload = build_payload(prompt, history, temperature, max_tokens, stream=True)
+
+    metrics.reset_connection_timings()
+    start_time = time.perf_counter()
+    received_tokens = False
+
+    try:
+        response = post_payload(session or get_http_session(), completions_url, agent_access_key, payload, stream=True)
+    except requests.exceptions.RequestException as e:
+        metrics.registry.record("stream", total=time.perf_counter() - start_time, error=str(e), **metrics.pop_connection_timings())
+        # Fallo de transporte: ResilientCaller decide si se reintenta
+        result["error"] = f"Error en la solicitud HTTP: {str(e)}"
+        result["transient"] = True
+        return
+
+    response_bytes = 0
+    usage = None
+    stream_error = None
+    fallback = False
+    try:
+        with response:
+            content_type = response.headers.get("Content-Type", "")
+
+            if response.status_code != 200:
+                # Error HTTP: se devuelve el código para que ResilientCaller decida si se reintenta
+                error_result, _ = parse_completion_response(response)
+                response_bytes = len(response.content)
+                stream_error = error_result["error"]
+                result.update(error_result)
+                return
+
+            if "text/event-stream" not in content_type:
+                # El endpoint ignoró "stream" y devolvió la respuesta completa
+                if "application/json" in content_type:
+                    response_data = wire_format.loads(response.content)
+                    response_bytes = len(response.content)
+                    usage = response_data.get("usage")
+                    choices = response_data.get("choices") or []
+                    if choices and "content" in (choices[0].get("message") or {}):
+                        result["ttft"] = time.perf_counter() - start_time
+                        yield choices[0]["message"]["content"]
+                        return
+
+                # Respuesta correcta pero en un formato desconocido: usar la ruta sin streaming
+                stream_error = "El endpoint no devolvió una respuesta en streaming"
+                fallback = True
+            else:
+                # Las líneas se leen como bytes: el decodificador JSON las interpreta sin pasar por str
+                for line in response.iter_lines():
+                    response_bytes += len(line) + 1
+                    if not line or not line.startswith(b"data:"):
+                        continue
+
+                    data = line[len(b"data:"):].strip()
+                    if data == b"[DONE]":
+                        break
+
+                    try:
+                        chunk = wire_format.loads(data)
+                    except ValueError:
+                        continue
+
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        if not received_tokens:
+                            received_tokens = True
+                            result["ttft"] = time.perf_counter() - start_time
+                        yield content
+
+    except requests.exceptions.RequestException as e:
+        stream_error = str(e)
+        if received_tokens:
+            # El stream se cortó a mitad de respuesta: conservar lo recibido
+            result["error"] = f"La respuesta se interrumpió: {stream_error}"
+        else:
+            result["error"] = f"Error en la solicitud HTTP: {stream_error}"
+            result["transient"] = True
+        return
+    except ValueError as e:
+        # Cuerpo JSON ilegible en una respuesta 200 sin streaming
+        stream_error = str(e)
+        fallback = True
+    finally:
+        record_response_metrics("stream", response, start_time, usage, error=stream_error,
+                                response_bytes=response_bytes, ttft=result.get("ttft"))
+
+    if not fallback:
+        return
+
+    # Fallback: solicitud sin streaming
+    response = request_completion(agent_endpoint, agent_access_key, prompt, history, temperature, max_tokens, session=session)
+    if "error" in response:
+        result.update(response)
+        return
+
+    result["ttft"] = time.perf_counter() - start_time
+    yield response.get("response", "No se recibió respuesta del asistente de Tampa Clean.")
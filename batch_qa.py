@@ -0,0 +1,255 @@
+# Modo por lotes: responder una lista de preguntas (CSV o JSONL) a través de la misma ruta
+# que el chat (despachador compartido, reintentos y circuit breaker).
+#
+# Los resultados se escriben a medida que llegan y la ejecución se puede reanudar: las preguntas
+# que ya tienen respuesta en el archivo de salida no se vuelven a enviar.
+#
+# Uso:
+#   TAMPA_ACCESS_KEY=... python batch_qa.py preguntas.csv -o respuestas.jsonl --concurrency 4 --warm-cache
+import argparse
+import concurrent.futures
+import csv
+import io
+import json
+import os
+import threading
+import time
+
+import agent_client
+from scheduler import PRIORITY_BACKGROUND, QueueTimeout
+
+# Paralelismo por defecto: por debajo del límite de concurrencia hacia el agente para no acaparar al chat
+BATCH_CONCURRENCY = int(os.environ.get("TAMPA_BATCH_CONCURRENCY", "4"))
+
+# Resultados de los lotes subidos desde la app (para poder reanudarlos)
+BATCH_DIR = os.environ.get(
+    "TAMPA_BATCH_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "batch")
+)
+
+RESULT_FIELDS = ["id", "prompt", "response", "error", "latency", "ts"]
+PROMPT_COLUMNS = ("prompt", "question", "pregunta")
+
+
+# Leer las preguntas de un CSV (columna prompt/question/pregunta o la primera) o de un JSONL
+def read_prompts(source, file_format=None):
+    if isinstance(source, (str, os.PathLike)):
+        file_format = file_format or ("jsonl" if str(source).endswith((".jsonl", ".json")) else "csv")
+        with open(source, encoding="utf-8-sig", newline="") as prompt_file:
+            return read_prompts(io.StringIO(prompt_file.read()), file_format)
+
+    if isinstance(source, bytes):
+        source = io.StringIO(source.decode("utf-8-sig"))
+
+    prompts = []
+    if file_format == "jsonl":
+        for line_number, line in enumerate(source, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"prompt": item}
+            if not isinstance(item, dict):
+                raise ValueError(f"línea {line_number}: se esperaba un objeto JSON o un texto")
+            prompt = next((item[column] for column in PROMPT_COLUMNS if item.get(column)), None)
+            if prompt is not None and not isinstance(prompt, str):
+                raise ValueError(f"línea {line_number}: la pregunta debe ser un texto")
+            if prompt:
+                prompts.append({"id": str(item.get("id") or len(prompts) + 1), "prompt": prompt})
+    else:
+        reader = csv.reader(source)
+        header = next(reader, None)
+        if header is None:
+            return prompts
+        columns = [column.strip().lower() for column in header]
+        prompt_index = next((columns.index(column) for column in PROMPT_COLUMNS if column in columns), None)
+        id_index = columns.index("id") if "id" in columns else None
+        rows = reader
+        if prompt_index is None:
+            # Sin cabecera reconocible: la primera fila ya es una pregunta
+            prompt_index = 0
+            rows = [header] + list(reader)
+        for row in rows:
+            if len(row) <= prompt_index or not row[prompt_index].strip():
+                continue
+            row_id = row[id_index] if id_index is not None and len(row) > id_index and row[id_index] else len(prompts) + 1
+            prompts.append({"id": str(row_id), "prompt": row[prompt_index].strip()})
+    return prompts
+
+
+def _output_format(path):
+    return "csv" if str(path).endswith(".csv") else "jsonl"
+
+
+# Resultados ya escritos en el archivo de salida (para reanudar)
+def read_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8", newline="") as results_file:
+        if _output_format(path) == "csv":
+            return list(csv.DictReader(results_file))
+        results = []
+        for line in results_file:
+            try:
+                results.append(json.loads(line))
+            except ValueError:
+                # Última línea a medio escribir si la ejecución se interrumpió
+                continue
+        return results
+
+
+def completed_ids(path):
+    return {str(result["id"]) for result in read_results(path) if result.get("response") and not result.get("error")}
+
+
+# Escritura incremental en JSONL o CSV (una fila por respuesta, segura entre hilos)
+class ResultWriter:
+    def __init__(self, path):
+        self.path = path
+        self.format = _output_format(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._lock = threading.Lock()
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, result):
+        with self._lock:
+            if self.format == "csv":
+                self._csv.writerow({field: result.get(field) for field in RESULT_FIELDS})
+            else:
+                self._file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# Ejecuta las preguntas con paralelismo acotado. Los objetos compartidos (despachador, planificador,
+# caché) se reciben ya creados: los hilos del lote no tienen contexto de Streamlit.
+class BatchRunner:
+    def __init__(self, dispatcher, agent_endpoint, agent_access_key, temperature=0.2, max_tokens=1000,
+                 concurrency=BATCH_CONCURRENCY, scheduler=None, response_cache=None):
+        self.dispatcher = dispatcher
+        self.agent_endpoint = agent_endpoint
+        self.agent_access_key = agent_access_key
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.concurrency = max(1, concurrency)
+        self.scheduler = scheduler
+        self.response_cache = response_cache
+
+    def _ask(self, item):
+        start = time.perf_counter()
+        try:
+            if self.scheduler is not None:
+                # Trabajo en segundo plano: el chat interactivo pasa primero
+                with self.scheduler.slot("batch", PRIORITY_BACKGROUND):
+                    response = self._query(item["prompt"])
+            else:
+                response = self._query(item["prompt"])
+        except QueueTimeout as e:
+            response = {"error": str(e)}
+
+        result = {
+            "id": item["id"],
+            "prompt": item["prompt"],
+            "response": response.get("response"),
+            "error": response.get("error"),
+            "latency": round(time.perf_counter() - start, 3),
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+        # Precalentar la caché con las respuestas correctas (preguntas sin contexto previo)
+        if self.response_cache is not None and result["response"] and not result["error"]:
+            self.response_cache.put(item["prompt"], self.temperature, self.max_tokens, result["response"])
+        return result
+
+    def _query(self, prompt):
+        return self.dispatcher.query(self.agent_endpoint, self.agent_access_key, prompt, None,
+                                     temperature=self.temperature, max_tokens=self.max_tokens)
+
+    # Genera cada resultado a medida que termina; se saltan las preguntas ya respondidas en "output_path"
+    def run(self, prompts, output_path, resume=True):
+        if not resume and os.path.exists(output_path):
+            os.remove(output_path)
+        done = completed_ids(output_path)
+        pending = [item for item in prompts if item["id"] not in done]
+        writer = ResultWriter(output_path)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-qa")
+        try:
+            # Solo se encolan "concurrency" preguntas a la vez: la memoria no crece con el tamaño del lote
+            iterator = iter(pending)
+            futures = {executor.submit(self._ask, item) for item in _take(iterator, self.concurrency)}
+            while futures:
+                finished, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    writer.write(result)
+                    yield result
+                futures |= {executor.submit(self._ask, item) for item in _take(iterator, len(finished))}
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            writer.close()
+
+
+def _take(iterator, count):
+    items = []
+    for item in iterator:
+        items.append(item)
+        if len(items) >= count:
+            break
+    return items
+
+
+def main():
+    # Fuera de Streamlit los objetos compartidos se crean directamente
+    from dispatcher import RequestDispatcher
+    from resilience import ResilientCaller
+    from response_cache import CACHE_DIR, ResponseCache
+
+    parser = argparse.ArgumentParser(description="Responder una lista de preguntas con el asistente Tampa Clean")
+    parser.add_argument("input", help="Archivo CSV o JSONL con las preguntas")
+    parser.add_argument("-o", "--output", help="Archivo de resultados (.jsonl o .csv)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Preguntas en paralelo")
+    parser.add_argument("--endpoint", default=agent_client.DEFAULT_AGENT_ENDPOINT)
+    parser.add_argument("--temperature", type=float, default=0.2)
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    parser.add_argument("--warm-cache", action="store_true", help="Guardar las respuestas en la caché de la app")
+    parser.add_argument("--no-resume", action="store_true", help="Volver a preguntar todo aunque ya haya resultados")
+    args = parser.parse_args()
+
+    # La clave se lee del entorno para que no quede en el historial de la terminal
+    access_key = os.environ.get("TAMPA_ACCESS_KEY", "")
+    if not access_key:
+        parser.error("Define la variable de entorno TAMPA_ACCESS_KEY con la clave de acceso")
+
+    output = args.output or os.path.splitext(args.input)[0] + ".respuestas.jsonl"
+    prompts = read_prompts(args.input)
+    dispatcher = RequestDispatcher(
+        args.concurrency,
+        session=agent_client.create_http_session(pool_maxsize=max(4, args.concurrency)),
+        caller=ResilientCaller()
+    )
+    cache = ResponseCache(os.path.join(CACHE_DIR, "responses.sqlite3")) if args.warm_cache else None
+    runner = BatchRunner(dispatcher, args.endpoint, access_key, args.temperature, args.max_tokens,
+                         args.concurrency, response_cache=cache)
+
+    done = len(completed_ids(output)) if not args.no_resume else 0
+    print(f"{len(prompts)} preguntas · {done} ya respondidas en {output}")
+    errors = 0
+    start = time.perf_counter()
+    for count, result in enumerate(runner.run(prompts, output, resume=not args.no_resume), 1):
+        errors += bool(result["error"])
+        status = "❌" if result["error"] else "✅"
+        print(f"[{count}] {status} {result['id']} ({result['latency']:.2f} s) {result['prompt'][:60]}")
+    print(f"Terminado en {time.perf_counter() - start:.1f} s · errores: {errors} · resultados en {output}")
+
+
+if __name__ == "__main__":
+    main()
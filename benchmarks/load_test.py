@@ -0,0 +1,268 @@
+# Prueba de carga de la ruta de consultas de la app contra el agente simulado (sin tocar producción).
+#
+# Cada sesión simulada repite lo que hace Inicio.py en cada turno: empaqueta el historial con
+# context_window.pack_history y consulta a través del despachador compartido (single-flight,
+# límite de concurrencia, reintentos y circuit breaker), en streaming o no.
+#
+# Uso:
+#   python benchmarks/load_test.py --sessions 50 --turns 6 --output resultados.json
+#   python benchmarks/load_test.py --sessions 20 --error-rate 0.1 --compare resultados.json
+#   python benchmarks/load_test.py --endpoint http://127.0.0.1:8765   # agente simulado ya arrancado
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# Las solicitudes de la prueba no se añaden al registro de métricas de la app
+os.environ.setdefault("TAMPA_METRICS_LOG", "")
+
+import agent_client
+import context_window
+from dispatcher import RequestDispatcher
+from mock_agent import MockAgentServer
+from resilience import ResilientCaller
+from session_memory import ChatMessage, deep_sizeof
+from ui_shell import EXAMPLE_QUESTIONS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "mean": statistics.mean(values) * 1000,
+        "p50": percentile(values, 0.5) * 1000,
+        "p95": percentile(values, 0.95) * 1000,
+        "p99": percentile(values, 0.99) * 1000,
+        "max": max(values) * 1000
+    }
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KiB y macOS en bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Una sesión de usuario: varios turnos con historial, como en Inicio.py
+def simulate_session(index, args, dispatcher, endpoint, start_barrier, turns_out):
+    rng = random.Random(args.seed + index if args.seed is not None else None)
+    messages = []
+    seq = 0
+    start_barrier.wait()
+
+    for turn in range(args.turns):
+        if rng.random() < args.repeat_rate:
+            # Pregunta frecuente compartida por todas las sesiones (se puede agrupar en vuelo)
+            emoji, prompt = rng.choice(EXAMPLE_QUESTIONS)
+        else:
+            prompt = f"Sesión {index}, pregunta {turn}: ¿cómo se organiza el servicio número {rng.randint(1, 10 ** 6)}?"
+
+        seq += 1
+        messages.append(ChatMessage("user", prompt, seq))
+        api_history, context_tokens = context_window.pack_history(messages[:-1], args.context_budget)
+
+        turn_start = time.perf_counter()
+        if args.stream:
+            result = {}
+            text = "".join(dispatcher.stream(endpoint, args.access_key, prompt, api_history,
+                                             temperature=0.2, max_tokens=1000, result=result))
+            if "error" not in result:
+                result["response"] = text
+        else:
+            result = dispatcher.query(endpoint, args.access_key, prompt, api_history, temperature=0.2, max_tokens=1000)
+        elapsed = time.perf_counter() - turn_start
+
+        seq += 1
+        if "error" in result:
+            messages.append(ChatMessage("assistant", f"{context_window.ERROR_MESSAGE_PREFIX} sobre Tampa Clean: {result['error']}",
+                                        seq, error=True))
+        else:
+            messages.append(ChatMessage("assistant", result["response"], seq))
+
+        turns_out.append({
+            "session": index,
+            "total": elapsed,
+            "ttft": result.get("ttft"),
+            "context_tokens": context_tokens,
+            "completion_tokens": context_window.estimate_tokens(result.get("response", "")),
+            "error": result.get("error"),
+            "circuit_open": bool(result.get("circuit_open"))
+        })
+
+        if args.think_time:
+            time.sleep(rng.uniform(0, 2 * args.think_time))
+
+    return messages
+
+
+def run(args):
+    server = None
+    endpoint = args.endpoint
+    if not endpoint:
+        server = MockAgentServer(
+            latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+            response_tokens=args.response_tokens, error_rate=args.error_rate, error_status=args.error_status,
+            disconnect_rate=args.disconnect_rate, seed=args.seed
+        ).start()
+        endpoint = server.url
+
+    http_session = agent_client.create_http_session(pool_maxsize=max(args.max_concurrency, 4))
+    caller = ResilientCaller()
+    dispatcher = RequestDispatcher(args.max_concurrency, session=http_session, caller=caller)
+
+    turns = []
+    histories = [None] * args.sessions
+    start_barrier = threading.Barrier(args.sessions + 1)
+    rss_before = peak_rss_bytes()
+
+    def worker(index):
+        histories[index] = simulate_session(index, args, dispatcher, endpoint, start_barrier, turns)
+
+    threads = [threading.Thread(target=worker, args=(i,), name=f"session-{i}") for i in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+
+    ok = [turn for turn in turns if not turn["error"]]
+    state_sizes = [deep_sizeof(history) for history in histories if history is not None]
+    completion_tokens = sum(turn["completion_tokens"] for turn in ok)
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {name: value for name, value in vars(args).items() if name not in ("output", "compare", "access_key")},
+        "duration_s": duration,
+        "turns": len(turns),
+        "errors": len(turns) - len(ok),
+        "error_rate": (len(turns) - len(ok)) / len(turns) if turns else 0.0,
+        "circuit_open": sum(turn["circuit_open"] for turn in turns),
+        "throughput_turns_per_s": len(ok) / duration if duration else 0.0,
+        "completion_tokens_per_s": completion_tokens / duration if duration else 0.0,
+        "latency_ms": summarize([turn["total"] for turn in ok]),
+        "ttft_ms": summarize([turn["ttft"] for turn in ok if turn["ttft"] is not None]),
+        "context_tokens_mean": statistics.mean(turn["context_tokens"] for turn in turns) if turns else 0.0,
+        "memory": {
+            "session_state_bytes_mean": statistics.mean(state_sizes) if state_sizes else 0,
+            "peak_rss_growth_bytes_per_session": max(0, peak_rss_bytes() - rss_before) / args.sessions
+        },
+        "dispatcher": dispatcher.stats(),
+        "resilience": {name: value for name, value in caller.stats().items() if name != "breaker"},
+        "mock_agent": server.stats() if server is not None else None
+    }
+
+
+def print_report(results):
+    print(f"Turnos: {results['turns']} en {results['duration_s']:.2f} s · errores: {results['errors']} "
+          f"({results['error_rate']:.1%}) · circuito abierto: {results['circuit_open']}")
+    print(f"Rendimiento: {results['throughput_turns_per_s']:.1f} turnos/s · "
+          f"{results['completion_tokens_per_s']:.0f} tokens/s")
+    for name, label in (("latency_ms", "Latencia del turno"), ("ttft_ms", "Primer token")):
+        values = results[name]
+        if values:
+            print(f"{label}: p50 {values['p50']:.0f} ms · p95 {values['p95']:.0f} ms · "
+                  f"p99 {values['p99']:.0f} ms · máx {values['max']:.0f} ms")
+    memory = results["memory"]
+    print(f"Memoria por sesión: estado ~{memory['session_state_bytes_mean'] / 1024:.1f} KiB · "
+          f"crecimiento del pico RSS ~{memory['peak_rss_growth_bytes_per_session'] / 1024:.1f} KiB")
+    print(f"Despachador: {results['dispatcher']['upstream_calls']} llamadas al agente, "
+          f"{results['dispatcher']['coalesced']} agrupadas · reintentos: {results['resilience']['retries']}")
+
+
+# Comparar con los resultados de otra versión (p. ej. la release anterior)
+def print_comparison(results, baseline):
+    rows = [
+        ("Turnos/s", results["throughput_turns_per_s"], baseline.get("throughput_turns_per_s")),
+        ("Tasa de error", results["error_rate"], baseline.get("error_rate")),
+        ("Estado por sesión (bytes)", results["memory"]["session_state_bytes_mean"],
+         (baseline.get("memory") or {}).get("session_state_bytes_mean"))
+    ]
+    for name in ("latency_ms", "ttft_ms"):
+        for q in ("p50", "p95", "p99"):
+            rows.append((f"{name} {q}", (results.get(name) or {}).get(q), (baseline.get(name) or {}).get(q)))
+
+    print(f"\nComparación con {baseline.get('revision') or 'la referencia'} ({baseline.get('timestamp', '?')}):")
+    for label, current, previous in rows:
+        if current is None or previous is None:
+            continue
+        change = f"{(current - previous) / previous:+.1%}" if previous else "n/a"
+        print(f"  {label:<28} {previous:>12.2f} → {current:>12.2f}  ({change})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la ruta de consultas contra un agente simulado")
+    parser.add_argument("--sessions", type=int, default=20, help="Sesiones simuladas concurrentes")
+    parser.add_argument("--turns", type=int, default=5, help="Turnos por sesión")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True, help="Usar streaming (SSE)")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Solicitudes simultáneas al agente")
+    parser.add_argument("--context-budget", type=int, default=context_window.DEFAULT_CONTEXT_BUDGET)
+    parser.add_argument("--repeat-rate", type=float, default=0.2, help="Fracción de preguntas frecuentes compartidas")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pausa media entre turnos (segundos)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--endpoint", help="Usar un agente ya arrancado en lugar del simulado interno")
+    parser.add_argument("--access-key", default="load-test")
+    # Comportamiento del agente simulado
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    # Resultados
+    parser.add_argument("--output", help="Guardar los resultados en un archivo JSON")
+    parser.add_argument("--compare", help="Resultados JSON de referencia con los que comparar")
+    args = parser.parse_args()
+
+    results = run(args)
+    print_report(results)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            print_comparison(results, json.load(baseline_file))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# Servidor local compatible con OpenAI (/api/v1/chat/completions) para pruebas sin el agente real.
+#
+# Simula latencia hasta el primer token, velocidad de generación (tokens/s), streaming SSE
+# y fallos (errores HTTP o streams cortados a mitad de respuesta). Acepta cuerpos comprimidos
+# (gzip/zstd) y lo anuncia con la cabecera Accept-Encoding, como un endpoint que los admite.
+#
+# Uso:
+#   python benchmarks/mock_agent.py --port 8765 --latency 0.3 --tokens-per-second 40
+#   python benchmarks/mock_agent.py --error-rate 0.1 --error-status 503 --disconnect-rate 0.05
+#   python benchmarks/mock_agent.py --request-encodings ""   # endpoint sin compresión de solicitudes
+#
+# Luego apuntar la app (o benchmarks/load_test.py --endpoint) a http://127.0.0.1:8765
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire_format
+
+
+class MockAgentHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self._send_accept_encoding()
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # La prueba de conexión de la app consulta /docs
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/docs", ""):
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"detail": "Not Found"})
+
+    # Compresiones de solicitud admitidas (RFC 7694)
+    def _send_accept_encoding(self):
+        if self.server.request_encodings:
+            self.send_header("Accept-Encoding", ", ".join(self.server.request_encodings))
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        encoding = self.headers.get("Content-Encoding", "").lower()
+        if encoding:
+            if encoding not in server.request_encodings:
+                self._send_json(415, {"detail": f"Content-Encoding no admitido: {encoding}"})
+                return
+            server.count("compressed_requests")
+            body = wire_format.decompress(body, encoding)
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"detail": "JSON no válido"})
+            return
+
+        if self.path.rstrip("/") != "/api/v1/chat/completions":
+            self._send_json(404, {"detail": "Not Found"})
+            return
+
+        server.count("requests")
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            server.count("errors")
+            self._send_json(401, {"detail": "Falta la clave de acceso"})
+            return
+
+        time.sleep(server.first_token_delay())
+        if server.roll(server.error_rate):
+            server.count("errors")
+            self._send_json(server.error_status, {"detail": "Error simulado"})
+            return
+
+        messages = payload.get("messages") or []
+        prompt = messages[-1]["content"] if messages else ""
+        tokens = server.response_tokens_for(prompt, len(messages))
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content", ""))) for m in messages) // 4,
+            "completion_tokens": len(tokens)
+        }
+
+        if payload.get("stream"):
+            self._stream(tokens, usage)
+        else:
+            # Sin streaming la respuesta llega completa cuando termina la generación
+            time.sleep(len(tokens) * server.token_interval())
+            server.count("completion_tokens", len(tokens))
+            self._send_json(200, {
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+
+    def _stream(self, tokens, usage):
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self._send_accept_encoding()
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        # Cortar el stream tras algunos tokens para simular una desconexión
+        cut_at = server.disconnect_point(len(tokens))
+        interval = server.token_interval()
+        try:
+            for i, token in enumerate(tokens):
+                if cut_at is not None and i == cut_at:
+                    server.count("disconnects")
+                    return
+                chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                server.count("completion_tokens")
+                if interval:
+                    time.sleep(interval)
+            final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            server.count("client_disconnects")
+
+
+# Servidor simulado; la configuración se puede cambiar en caliente desde las pruebas
+class MockAgentServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.2, jitter=0.05, tokens_per_second=50.0,
+                 response_tokens=60, error_rate=0.0, error_status=503, disconnect_rate=0.0, seed=None,
+                 request_encodings=None):
+        super().__init__((host, port), MockAgentHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.disconnect_rate = disconnect_rate
+        self.request_encodings = wire_format.supported_encodings() if request_encodings is None else tuple(request_encodings)
+        self._random = random.Random(seed)
+        self._counters = {"requests": 0, "errors": 0, "disconnects": 0, "client_disconnects": 0, "completion_tokens": 0,
+                          "compressed_requests": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def roll(self, probability):
+        with self._lock:
+            return probability > 0 and self._random.random() < probability
+
+    # Token tras el que se corta el stream (None si no se corta); con la semilla de --seed
+    def disconnect_point(self, token_count):
+        with self._lock:
+            if self.disconnect_rate <= 0 or self._random.random() >= self.disconnect_rate:
+                return None
+            return self._random.randint(1, max(1, token_count - 1))
+
+    def first_token_delay(self):
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def token_interval(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    # Respuesta determinista a partir de la pregunta (misma pregunta, misma respuesta)
+    def response_tokens_for(self, prompt, message_count):
+        words = [f"Respuesta simulada a «{prompt[:60]}» con {message_count} mensajes de contexto."]
+        filler = "Tampa Clean ofrece limpieza residencial y comercial con personal capacitado".split()
+        words.extend(filler[i % len(filler)] for i in range(max(0, self.response_tokens - 1)))
+        return [word + " " for word in words]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    # Arrancar en un hilo aparte (para usarlo desde el harness de carga)
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="mock-agent", daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agente simulado compatible con OpenAI para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Segundos hasta el primer token")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Variación aleatoria de la latencia (± segundos)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Velocidad de generación (0 = instantánea)")
+    parser.add_argument("--response-tokens", type=int, default=60, help="Tokens por respuesta")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de solicitudes que fallan")
+    parser.add_argument("--error-status", type=int, default=503, help="Código HTTP de los errores simulados")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Fracción de streams cortados a mitad")
+    parser.add_argument("--seed", type=int, help="Semilla para reproducir los fallos simulados")
+    parser.add_argument("--request-encodings", default=",".join(wire_format.supported_encodings()),
+                        help="Compresiones de solicitud admitidas, separadas por comas (vacío = ninguna)")
+    args = parser.parse_args()
+
+    server = MockAgentServer(
+        args.host, args.port, latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens, error_rate=args.error_rate, error_status=args.error_status,
+        disconnect_rate=args.disconnect_rate, seed=args.seed,
+        request_encodings=[encoding.strip() for encoding in args.request_encodings.split(",") if encoding.strip()]
+    )
+    print(f"Agente simulado en {server.url}/api/v1/chat/completions (Ctrl+C para salir)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Micro-benchmark de la preparación de solicitudes y la lectura de respuestas (CPU por turno).
+#
+# Para cada longitud de conversación mide, sin red:
+#   - empaquetado del historial (context_window.pack_history) y construcción del payload
+#   - serialización: JSON como lo enviaba requests (json=...) frente a wire_format.dumps
+#   - compresión del cuerpo (gzip y, si está instalado, zstd): tiempo y bytes enviados
+#   - clave de agrupación del despachador (request_key)
+#   - lectura de la respuesta completa y de los eventos SSE: json estándar frente a wire_format.loads
+#
+# Uso:
+#   python benchmarks/payload_benchmark.py
+#   python benchmarks/payload_benchmark.py --lengths 2 20 200 --context-budget 100000 --output resultados.json
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("TAMPA_METRICS_LOG", "")
+
+import agent_client
+import context_window
+import wire_format
+from dispatcher import request_key
+from session_memory import ChatMessage
+
+USER_TEXT = "¿Qué productos de limpieza usan en las cocinas y cómo se organiza el servicio número {i} en Tampa?"
+ASSISTANT_TEXT = (
+    "En Tampa Clean usamos productos ecológicos certificados para cocinas: desengrasantes sin amoníaco, "
+    "paños de microfibra y desinfectantes aprobados. El equipo limpia primero superficies altas, después "
+    "electrodomésticos y al final el piso. Para el servicio número {i} la duración estimada es de dos horas. "
+) * 2
+
+
+def conversation(length):
+    return [
+        ChatMessage("user" if i % 2 == 0 else "assistant", (USER_TEXT if i % 2 == 0 else ASSISTANT_TEXT).format(i=i), i + 1)
+        for i in range(length)
+    ]
+
+
+def completion_body(tokens):
+    content = " ".join(f"palabra{i}" for i in range(tokens))
+    return json.dumps({
+        "id": "chatcmpl-benchmark", "object": "chat.completion", "created": 0, "model": "n/a",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1000, "completion_tokens": tokens, "total_tokens": 1000 + tokens}
+    }).encode("utf-8")
+
+
+def sse_lines(tokens):
+    return [
+        f"data: {json.dumps({'choices': [{'index': 0, 'delta': {'content': f'palabra{i} '}}]})}".encode("utf-8")
+        for i in range(tokens)
+    ]
+
+
+# Microsegundos por llamada (mediana de varias repeticiones)
+def measure(function, repeat):
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    timings = sorted(timer.repeat(repeat=repeat, number=number))
+    return timings[len(timings) // 2] / number * 1e6
+
+
+# Lo que hacía requests con json=payload: json.dumps con espacios y escapes \uXXXX
+def legacy_dumps(payload):
+    return json.dumps(payload).encode("utf-8")
+
+
+def legacy_sse(lines):
+    for line in lines:
+        json.loads(line.decode("utf-8")[len("data:"):].strip())
+
+
+def fast_sse(lines):
+    for line in lines:
+        wire_format.loads(line[len(b"data:"):].strip())
+
+
+def run_length(length, args):
+    messages = conversation(length)
+    history, _ = context_window.pack_history(messages, args.context_budget)
+    payload = agent_client.build_payload("¿Y cuánto cuesta?", history, 0.2, 1000)
+    legacy_body = legacy_dumps(payload)
+    body = wire_format.dumps(payload)
+    response = completion_body(args.response_tokens)
+    lines = sse_lines(args.response_tokens)
+
+    timings = {
+        "pack_history": measure(lambda: context_window.pack_history(messages, args.context_budget), args.repeat),
+        "build_payload": measure(lambda: agent_client.build_payload("¿Y cuánto cuesta?", history, 0.2, 1000), args.repeat),
+        "serialize_legacy": measure(lambda: legacy_dumps(payload), args.repeat),
+        "serialize": measure(lambda: wire_format.dumps(payload), args.repeat),
+        "request_key": measure(lambda: request_key("https://agente", "clave", payload), args.repeat),
+        "parse_legacy": measure(lambda: json.loads(response), args.repeat),
+        "parse": measure(lambda: wire_format.loads(response), args.repeat),
+        "sse_legacy": measure(lambda: legacy_sse(lines), args.repeat),
+        "sse": measure(lambda: fast_sse(lines), args.repeat)
+    }
+    sizes = {"legacy": len(legacy_body), "compact": len(body)}
+    for encoding in wire_format.supported_encodings():
+        timings[f"compress_{encoding}"] = measure(lambda: wire_format.compress(body, encoding), args.repeat)
+        sizes[encoding] = len(wire_format.compress(body, encoding))
+
+    # CPU de un turno en streaming: antes (json de requests) y ahora (con la mejor compresión si el endpoint la admite)
+    best = wire_format.supported_encodings()[0]
+    common = timings["pack_history"] + timings["build_payload"] + timings["request_key"]
+    return {
+        "messages": length,
+        "messages_sent": len(payload["messages"]),
+        "us": timings,
+        "bytes": sizes,
+        "turn_us_legacy": common + timings["serialize_legacy"] + timings["sse_legacy"],
+        "turn_us": common + timings["serialize"] + timings["sse"],
+        "turn_us_compressed": common + timings["serialize"] + timings[f"compress_{best}"] + timings["sse"]
+    }
+
+
+def print_report(results):
+    print(f"JSON: {results['json']} · compresión: {', '.join(results['encodings'])} · "
+          f"tokens por respuesta: {results['config']['response_tokens']}")
+    header = (f"{'mensajes':>8} {'enviados':>8} {'empaquetar':>10} {'payload':>8} {'json ant.':>9} {'json':>7} "
+              f"{'gzip':>7} {'sse ant.':>9} {'sse':>7} {'bytes ant.':>10} {'bytes':>7} {'gzip':>7}")
+    print(header)
+    for row in results["lengths"]:
+        us, sizes = row["us"], row["bytes"]
+        print(f"{row['messages']:>8} {row['messages_sent']:>8} {us['pack_history']:>10.1f} {us['build_payload']:>8.1f} "
+              f"{us['serialize_legacy']:>9.1f} {us['serialize']:>7.1f} {us['compress_gzip']:>7.1f} "
+              f"{us['sse_legacy']:>9.1f} {us['sse']:>7.1f} {sizes['legacy']:>10} {sizes['compact']:>7} {sizes['gzip']:>7}")
+    print("\nCPU por turno en streaming (µs): antes → ahora (ahora + compresión)")
+    for row in results["lengths"]:
+        print(f"  {row['messages']:>4} mensajes: {row['turn_us_legacy']:>9.1f} → {row['turn_us']:>9.1f} "
+              f"({row['turn_us_compressed']:.1f})")
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark del payload de las solicitudes y de la lectura de respuestas")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[2, 10, 50, 200], help="Mensajes en la conversación")
+    parser.add_argument("--context-budget", type=int, default=context_window.DEFAULT_CONTEXT_BUDGET,
+                        help="Presupuesto de tokens del historial (como en la app)")
+    parser.add_argument("--response-tokens", type=int, default=300, help="Tokens de la respuesta simulada")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeticiones por medida (se usa la mediana)")
+    parser.add_argument("--output", help="Guardar los resultados en un archivo JSON")
+    args = parser.parse_args()
+
+    results = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {name: value for name, value in vars(args).items() if name != "output"},
+        "json": "orjson" if wire_format.orjson is not None else "json (biblioteca estándar)",
+        "encodings": list(wire_format.supported_encodings()),
+        "lengths": [run_length(length, args) for length in args.lengths]
+    }
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Benchmark de arranque y reruns de la app con streamlit.testing (AppTest).
+#
+# Mide:
+#   - arranque en frío: primer run de la app en un proceso nuevo (incluye importaciones)
+#   - reruns en caliente: runs posteriores de la misma sesión
+#
+# Uso:
+#   python benchmarks/startup_benchmark.py --cold-runs 5 --reruns 20 --messages 200
+#   python benchmarks/startup_benchmark.py --screen login --output resultados.json
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "Inicio.py")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+# Se ejecuta en un proceso hijo: un arranque en frío seguido de reruns en caliente
+def run_child(screen, messages, reruns):
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    import_time = time.perf_counter() - start
+
+    at = AppTest.from_file(APP, default_timeout=120)
+    if screen == "chat":
+        at.session_state.is_configured = True
+        at.session_state.agent_access_key = "benchmark"
+        # Endpoint inalcanzable: el benchmark nunca consulta al agente
+        at.session_state.agent_endpoint = "http://127.0.0.1:9"
+        if messages:
+            at.session_state.messages = [
+                {"role": "user" if i % 2 == 0 else "assistant", "content": f"Mensaje de prueba {i}. " * 20, "seq": i + 1}
+                for i in range(messages)
+            ]
+            at.session_state.message_seq = messages
+            at.session_state.history_loaded = True
+
+    cold_start = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - cold_start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+
+    warm = []
+    for _ in range(reruns):
+        rerun_start = time.perf_counter()
+        at.run()
+        warm.append(time.perf_counter() - rerun_start)
+
+    return {"streamlit_import": import_time, "cold": cold, "warm": warm}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque y reruns de Inicio.py")
+    parser.add_argument("--cold-runs", type=int, default=5, help="Procesos nuevos para medir el arranque en frío")
+    parser.add_argument("--reruns", type=int, default=20, help="Reruns en caliente por proceso")
+    parser.add_argument("--messages", type=int, default=0, help="Mensajes precargados en el historial")
+    parser.add_argument("--screen", choices=["chat", "login"], default="chat", help="Pantalla a medir")
+    parser.add_argument("--output", help="Guardar los resultados en un archivo JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.screen, args.messages, args.reruns)))
+        return
+
+    # Datos temporales aislados: el benchmark no toca la caché ni las conversaciones reales
+    data_dir = tempfile.mkdtemp(prefix="tampa-bench-")
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")])),
+        "TAMPA_CACHE_DIR": os.path.join(data_dir, "cache"),
+        "TAMPA_STORE_PATH": os.path.join(data_dir, "conversations.sqlite3"),
+        "TAMPA_METRICS_LOG": "",
+    })
+
+    runs = []
+    try:
+        for _ in range(args.cold_runs):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--screen", args.screen,
+                 "--messages", str(args.messages), "--reruns", str(args.reruns)],
+                env=env, cwd=ROOT, capture_output=True, text=True, check=True
+            ).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    cold = [run["cold"] for run in runs]
+    warm = [value for run in runs for value in run["warm"]]
+    results = {
+        "screen": args.screen,
+        "messages": args.messages,
+        "cold_runs": args.cold_runs,
+        "reruns": args.reruns,
+        "cold_start_ms": {
+            "mean": statistics.mean(cold) * 1000,
+            "p50": percentile(cold, 0.5) * 1000,
+            "max": max(cold) * 1000
+        },
+        "warm_rerun_ms": {
+            "mean": statistics.mean(warm) * 1000 if warm else 0.0,
+            "p50": percentile(warm, 0.5) * 1000,
+            "p95": percentile(warm, 0.95) * 1000
+        },
+        "streamlit_import_ms": statistics.mean(run["streamlit_import"] for run in runs) * 1000
+    }
+
+    print(f"Pantalla: {args.screen} · mensajes precargados: {args.messages}")
+    print(f"Arranque en frío: media {results['cold_start_ms']['mean']:.1f} ms · "
+          f"p50 {results['cold_start_ms']['p50']:.1f} ms · máx {results['cold_start_ms']['max']:.1f} ms")
+    print(f"Rerun en caliente: media {results['warm_rerun_ms']['mean']:.1f} ms · "
+          f"p50 {results['warm_rerun_ms']['p50']:.1f} ms · p95 {results['warm_rerun_ms']['p95']:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import math
+
+# Presupuesto de tokens por defecto para el historial que se envía al agente
+DEFAULT_CONTEXT_BUDGET = 1500
+
+# Tokens reservados para el resumen de los turnos antiguos
+SUMMARY_BUDGET = 200
+
+# Prefijo de los mensajes de error sintéticos que se añaden al historial
+ERROR_MESSAGE_PREFIX = "Lo siento, ocurrió un error al procesar tu consulta"
+
+# Sobrecoste aproximado por mensaje (rol, separadores) en el formato de chat
+TOKENS_PER_MESSAGE = 4
+
+
+# Estimación rápida de tokens (~4 caracteres por token en español/inglés)
+def estimate_tokens(text):
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def estimate_message_tokens(message):
+    return TOKENS_PER_MESSAGE + estimate_tokens(message.get("content", ""))
+
+
+# Los mensajes de error no aportan contexto útil al agente
+def is_error_placeholder(message):
+    if message.get("error"):
+        return True
+    return message.get("role") == "assistant" and message.get("content", "").startswith(ERROR_MESSAGE_PREFIX)
+
+
+# Resumen compacto de los turnos descartados: solo las preguntas del usuario, recortadas
+def summarize_turns(messages, budget_tokens=SUMMARY_BUDGET):
+    questions = [msg["content"].strip() for msg in messages if msg.get("role") == "user"]
+    if not questions:
+        return None
+
+    header = "Resumen de la conversación anterior. El usuario preguntó antes sobre:"
+    used = estimate_tokens(header)
+    lines = []
+    # Priorizar las preguntas más recientes
+    for question in reversed(questions):
+        line = f"- {question[:120]}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget_tokens:
+            break
+        lines.append(line)
+        used += cost
+
+    if not lines:
+        return None
+
+    lines.reverse()
+    return {"role": "system", "content": "\n".join([header] + lines)}
+
+
+# Seleccionar los turnos más recientes que caben en el presupuesto de tokens.
+# Devuelve (mensajes, tokens estimados); los turnos más antiguos se resumen o se descartan.
+def pack_history(history, budget_tokens=DEFAULT_CONTEXT_BUDGET, summarize=True):
+    if not history:
+        return [], 0
+
+    candidates = [msg for msg in history if not is_error_placeholder(msg)]
+
+    summary_budget = min(SUMMARY_BUDGET, budget_tokens // 4) if summarize else 0
+    available = budget_tokens - summary_budget
+
+    kept = []
+    used = 0
+    for message in reversed(candidates):
+        cost = estimate_message_tokens(message)
+        if used + cost > available:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+
+    # Evitar que el contexto empiece con una respuesta sin su pregunta
+    while kept and kept[0].get("role") == "assistant":
+        used -= estimate_message_tokens(kept.pop(0))
+
+    packed = [{"role": msg["role"], "content": msg["content"]} for msg in kept]
+
+    dropped = candidates[:len(candidates) - len(kept)]
+    if summarize and dropped:
+        summary = summarize_turns(dropped, summary_budget)
+        if summary:
+            packed.insert(0, summary)
+            used += estimate_message_tokens(summary)
+
+    return packed, used
@@ -0,0 +1,288 @@
+import hashlib
+import logging
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from session_memory import ChatMessage
+
+# Base de datos de conversaciones (persistente, no es una caché)
+STORE_PATH = os.environ.get(
+    "TAMPA_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "conversations.sqlite3")
+)
+# Escrituras agrupadas: hasta WRITE_BATCH_SIZE mensajes o WRITE_BATCH_INTERVAL segundos
+WRITE_BATCH_SIZE = 200
+WRITE_BATCH_INTERVAL = 0.25
+# Reintentos de un lote que SQLite rechaza (base bloqueada, disco lleno...), con espera exponencial
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 0.5
+# Mensajes que se cargan por página al recuperar una conversación
+PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    user_key TEXT,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id),
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    is_error INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    UNIQUE (conversation_id, seq)
+);
+CREATE INDEX IF NOT EXISTS conversations_user ON conversations (user_key, updated_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    content='messages',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+# Identificador de la clave de acceso (sin guardarla). Las conversaciones quedan asociadas a la
+# clave, no a una persona: todas las sesiones que entran con la misma clave comparten sus conversaciones.
+def user_key(agent_access_key):
+    return hashlib.sha256(agent_access_key.encode("utf-8")).hexdigest()[:16]
+
+
+# Convertir el texto del usuario en una consulta FTS5 segura (términos con prefijo)
+def fts_query(text):
+    terms = re.findall(r"\w+", text)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+_STOP = object()
+
+logger = logging.getLogger(__name__)
+
+
+# Almacén de conversaciones en SQLite (WAL + FTS5).
+# Las escrituras se encolan y un hilo en segundo plano las guarda por lotes.
+class ConversationStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self._readers = threading.local()
+        self._queue = queue.Queue()
+        self.dropped = 0  # mensajes que no se pudieron guardar
+        self.last_error = None
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    # Una conexión de lectura por hilo (WAL permite leer mientras se escribe)
+    def _reader(self):
+        connection = getattr(self._readers, "connection", None)
+        if connection is None:
+            connection = self._connect()
+            self._readers.connection = connection
+        return connection
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + WRITE_BATCH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    next_item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if next_item is _STOP:
+                    self._queue.put(_STOP)
+                    self._queue.task_done()
+                    break
+                batch.append(next_item)
+
+            try:
+                self._write_with_retries(connection, batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        connection.close()
+
+    # Guardar un lote reintentando si SQLite falla. Si sigue fallando, se guarda mensaje a mensaje
+    # y solo se descartan (y se cuentan en "dropped") los que no se pueden guardar.
+    def _write_with_retries(self, connection, batch):
+        for attempt in range(WRITE_RETRIES):
+            try:
+                self._write_batch(connection, batch)
+                return
+            except sqlite3.Error as e:
+                logger.warning("Error al guardar %d mensajes (intento %d de %d): %s", len(batch), attempt + 1, WRITE_RETRIES, e)
+                self.last_error = str(e)
+                if attempt + 1 < WRITE_RETRIES:
+                    time.sleep(WRITE_RETRY_DELAY * (2 ** attempt))
+            except Exception as e:
+                # Mensaje con datos no válidos: reintentar no sirve
+                logger.warning("Error al guardar %d mensajes: %s", len(batch), e)
+                self.last_error = str(e)
+                break
+
+        lost = 0
+        for item in batch:
+            try:
+                self._write_batch(connection, [item])
+            except Exception as e:
+                self.last_error = str(e)
+                lost += 1
+        if lost:
+            self.dropped += lost
+            logger.error("Se descartaron %d mensajes que no se pudieron guardar: %s", lost, self.last_error)
+
+    @staticmethod
+    def _write_batch(connection, batch):
+        with connection:
+            connection.executemany(
+                "INSERT INTO conversations (id, user_key, title, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, "
+                "title = COALESCE(conversations.title, excluded.title)",
+                [
+                    (conversation_id, owner, content[:120] if role == "user" else None, created_at, created_at)
+                    for conversation_id, owner, seq, role, content, is_error, created_at in batch
+                ]
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO messages (conversation_id, seq, role, content, is_error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (conversation_id, seq, role, content, int(is_error), created_at)
+                    for conversation_id, owner, seq, role, content, is_error, created_at in batch
+                ]
+            )
+
+    # Encolar un mensaje (no bloquea la interfaz)
+    def save_message(self, conversation_id, owner, seq, role, content, is_error=False):
+        self._queue.put((conversation_id, owner, seq, role, content, bool(is_error), time.time()))
+
+    # Esperar a que se escriban los mensajes pendientes
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    # Página de mensajes en orden cronológico: los "limit" anteriores a before_seq (o los últimos; -1 = todos)
+    def load_messages(self, conversation_id, limit=PAGE_SIZE, before_seq=None):
+        if before_seq is None:
+            before_seq = 2 ** 62
+        rows = self._reader().execute(
+            "SELECT seq, role, content, is_error FROM messages "
+            "WHERE conversation_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (conversation_id, before_seq, limit)
+        ).fetchall()
+        return [ChatMessage(role, content, seq, is_error) for seq, role, content, is_error in reversed(rows)]
+
+    def has_messages_before(self, conversation_id, seq):
+        row = self._reader().execute(
+            "SELECT 1 FROM messages WHERE conversation_id = ? AND seq < ? LIMIT 1",
+            (conversation_id, seq)
+        ).fetchone()
+        return row is not None
+
+    def last_seq(self, conversation_id):
+        row = self._reader().execute(
+            "SELECT MAX(seq) FROM messages WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+    # Preguntas del usuario (sin errores) guardadas después de "after_id", en orden de inserción:
+    # [(id, conversation_id, seq, content)]
+    def user_prompts(self, after_id=0, limit=5000):
+        return self._reader().execute(
+            "SELECT id, conversation_id, seq, content FROM messages "
+            "WHERE id > ? AND role = 'user' AND is_error = 0 ORDER BY id LIMIT ?",
+            (after_id, limit)
+        ).fetchall()
+
+    # Clave de acceso con la que se guardó una conversación (None si aún no está guardada)
+    def conversation_owner(self, conversation_id):
+        row = self._reader().execute("SELECT user_key FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else None
+
+    def list_conversations(self, owner=None, limit=20):
+        if owner is None:
+            rows = self._reader().execute(
+                "SELECT id, title, updated_at FROM conversations ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            rows = self._reader().execute(
+                "SELECT id, title, updated_at FROM conversations WHERE user_key = ? "
+                "ORDER BY updated_at DESC LIMIT ?", (owner, limit)
+            ).fetchall()
+        return [{"id": row[0], "title": row[1], "updated_at": row[2]} for row in rows]
+
+    # Búsqueda de texto completo en las conversaciones guardadas con la clave "owner" (en todas si es None).
+    # Se devuelven primero los más recientes (rowid descendente), lo que evita puntuar todas las coincidencias.
+    def search(self, text, owner=None, limit=20):
+        query = fts_query(text)
+        if not query:
+            return []
+        if owner is None:
+            rows = self._reader().execute(
+                "SELECT m.conversation_id, m.seq, m.role, m.created_at, "
+                "snippet(messages_fts, 0, '**', '**', '…', 16) "
+                "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                "WHERE messages_fts MATCH ? AND m.is_error = 0 "
+                "ORDER BY messages_fts.rowid DESC LIMIT ?",
+                (query, limit)
+            ).fetchall()
+        else:
+            rows = self._reader().execute(
+                "SELECT m.conversation_id, m.seq, m.role, m.created_at, "
+                "snippet(messages_fts, 0, '**', '**', '…', 16) "
+                "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE messages_fts MATCH ? AND m.is_error = 0 AND c.user_key = ? "
+                "ORDER BY messages_fts.rowid DESC LIMIT ?",
+                (query, owner, limit)
+            ).fetchall()
+        return [
+            {"conversation_id": row[0], "seq": row[1], "role": row[2], "created_at": row[3], "snippet": row[4]}
+            for row in rows
+        ]
+
+
+# Almacén único por proceso
+@st.cache_resource
+def get_conversation_store():
+    return ConversationStore()
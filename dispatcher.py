@@ -0,0 +1,176 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+import streamlit as st
+
+import agent_client
+import resilience
+
+# Máximo de solicitudes simultáneas hacia el endpoint del agente
+MAX_UPSTREAM_CONCURRENCY = int(os.environ.get("TAMPA_MAX_UPSTREAM_CONCURRENCY", "8"))
+
+
+# Clave de coalescencia: dos solicitudes con el mismo destino y payload comparten la llamada
+def request_key(agent_endpoint, agent_access_key, payload):
+    raw = json.dumps([agent_endpoint, agent_access_key, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Respuesta en streaming compartida: guarda los fragmentos recibidos para que
+# cualquier sesión que se una tarde reciba también los anteriores
+class StreamBroadcast:
+    def __init__(self):
+        self.chunks = []
+        self.result = {}
+        self.done = False
+        self._condition = threading.Condition()
+
+    def publish(self, chunk):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def finish(self, result):
+        with self._condition:
+            self.result = dict(result)
+            self.done = True
+            self._condition.notify_all()
+
+    def subscribe(self, timeout=agent_client.COMPLETION_TIMEOUT + resilience.RETRY_TOTAL_BUDGET):
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self.chunks) and not self.done:
+                    if not self._condition.wait(timeout):
+                        raise TimeoutError("Tiempo de espera agotado esperando la respuesta del asistente")
+                pending = self.chunks[index:]
+                done = self.done
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if done and index >= len(self.chunks):
+                return
+
+
+# Despachador asíncrono compartido por todas las sesiones.
+# Agrupa las solicitudes idénticas en curso en una sola llamada (single-flight),
+# limita la concurrencia hacia el agente con un semáforo y reparte el resultado.
+class RequestDispatcher:
+    def __init__(self, max_concurrency=MAX_UPSTREAM_CONCURRENCY, session=None, caller=None):
+        self.max_concurrency = max_concurrency
+        self._session = session or agent_client.get_http_session()
+        self._caller = caller or resilience.get_resilient_caller()
+        self.upstream_calls = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._broadcasts = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="agent-upstream"
+        )
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._thread = threading.Thread(target=self._run_loop, name="agent-dispatcher", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._init_semaphore(), self._loop).result()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    async def _init_semaphore(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _call_upstream(self, func, *args):
+        async with self._semaphore:
+            self.upstream_calls += 1
+            return await self._loop.run_in_executor(self._executor, func, *args)
+
+    async def _query(self, key, args):
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._loop.create_task(self._call_upstream(self._request, args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: si un solicitante se cancela, los demás siguen esperando el resultado
+        return dict(await asyncio.shield(task))
+
+    async def _open_stream(self, key, args):
+        broadcast = self._broadcasts.get(key)
+        if broadcast is not None:
+            self.coalesced += 1
+            return broadcast
+
+        broadcast = StreamBroadcast()
+        self._broadcasts[key] = broadcast
+        task = self._loop.create_task(self._call_upstream(self._pump_stream, broadcast, args))
+        task.add_done_callback(lambda _: self._broadcasts.pop(key, None))
+        return broadcast
+
+    def _request(self, args):
+        return self._caller.query(args, session=self._session)
+
+    def _pump_stream(self, broadcast, args):
+        result = {}
+        try:
+            for chunk in self._caller.stream(args, session=self._session, result=result):
+                broadcast.publish(chunk)
+        except Exception as e:
+            result["error"] = f"Error al comunicarse con el asistente: {str(e)}"
+        finally:
+            broadcast.finish(result)
+
+    def query(self, agent_endpoint, agent_access_key, prompt, history=None, temperature=0.2, max_tokens=1000):
+        payload = agent_client.build_payload(prompt, history, temperature, max_tokens)
+        key = request_key(agent_endpoint, agent_access_key, payload)
+        args = (agent_endpoint, agent_access_key, prompt, history, temperature, max_tokens)
+        future = asyncio.run_coroutine_threadsafe(self._query(key, args), self._loop)
+        try:
+            return future.result(timeout=self._caller.total_budget + agent_client.COMPLETION_TIMEOUT)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return {"error": "Tiempo de espera agotado esperando la respuesta del asistente"}
+
+    def stream(self, agent_endpoint, agent_access_key, prompt, history=None, temperature=0.2, max_tokens=1000, result=None):
+        if result is None:
+            result = {}
+        payload = agent_client.build_payload(prompt, history, temperature, max_tokens, stream=True)
+        key = request_key(agent_endpoint, agent_access_key, payload)
+        args = (agent_endpoint, agent_access_key, prompt, history, temperature, max_tokens)
+
+        start_time = time.perf_counter()
+        broadcast = asyncio.run_coroutine_threadsafe(self._open_stream(key, args), self._loop).result()
+        first_chunk = True
+        try:
+            for chunk in broadcast.subscribe():
+                if first_chunk:
+                    first_chunk = False
+                    result["ttft"] = time.perf_counter() - start_time
+                yield chunk
+        except TimeoutError as e:
+            result["error"] = str(e)
+            return
+
+        for name, value in broadcast.result.items():
+            if name != "ttft":
+                result[name] = value
+
+    def stats(self):
+        return {
+            "in_flight": len(self._in_flight) + len(self._broadcasts),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+            "max_concurrency": self.max_concurrency
+        }
+
+
+# Despachador único por proceso
+@st.cache_resource
+def get_dispatcher():
+    return RequestDispatcher()
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+import streamlit as st
+
+import agent_client
+import metrics
+from resilience import LatencyTracker
+from scheduler import PRIORITY_BACKGROUND, QueueTimeout, get_scheduler
+
+# Comprobación periódica del endpoint (variables de entorno)
+HEALTH_INTERVAL = float(os.environ.get("TAMPA_HEALTH_INTERVAL", "30"))
+# Ruta barata que se consulta: no genera tokens ni necesita la clave de acceso
+HEALTH_PATH = os.environ.get("TAMPA_HEALTH_PATH", "docs")
+# Comprobaciones recientes con las que se calculan disponibilidad y latencia
+HEALTH_WINDOW = int(os.environ.get("TAMPA_HEALTH_WINDOW", "60"))
+# Latencia (p95) a partir de la cual el asistente se considera degradado
+HEALTH_SLOW_THRESHOLD = float(os.environ.get("TAMPA_HEALTH_SLOW_THRESHOLD", "2"))
+
+AVAILABLE = "disponible"
+DEGRADED = "degradado"
+DOWN = "no disponible"
+UNKNOWN = "sin datos"
+STATE_ICONS = {AVAILABLE: "🟢", DEGRADED: "🟡", DOWN: "🔴", UNKNOWN: "⚪"}
+
+
+# Comprobación de salud en segundo plano, una por proceso.
+# Cada sesión solo lee el último estado (no espera a la red).
+class HealthMonitor:
+    def __init__(self, agent_endpoint, session=None, scheduler=None, interval=HEALTH_INTERVAL,
+                 window=HEALTH_WINDOW, path=HEALTH_PATH):
+        self.url = f"{agent_client.normalize_endpoint(agent_endpoint)}{path}"
+        self.interval = interval
+        self.checks = deque(maxlen=window)  # (instante, correcto, latencia, estado HTTP o error)
+        self.latency = LatencyTracker(size=window)
+        self.consecutive_failures = 0
+        self.skipped = 0
+        self._session = session or agent_client.get_http_session()
+        self._scheduler = scheduler
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check()
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    # Pedir una comprobación inmediata sin esperarla
+    def check_now(self):
+        self._wake.set()
+
+    def check(self):
+        # Trabajo de segundo plano: si la cola está llena se omite y se vuelve a intentar en el siguiente ciclo
+        if self._scheduler is not None:
+            try:
+                self._scheduler.acquire("health-monitor", PRIORITY_BACKGROUND, timeout=self.interval)
+            except QueueTimeout:
+                self.skipped += 1
+                return
+        try:
+            self._probe()
+        finally:
+            if self._scheduler is not None:
+                self._scheduler.release()
+
+    def _probe(self):
+        metrics.reset_connection_timings()
+        start = time.perf_counter()
+        try:
+            response = self._session.get(self.url, timeout=agent_client.PROBE_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            elapsed = time.perf_counter() - start
+            metrics.registry.record("probe", total=elapsed, error=str(e), **metrics.pop_connection_timings())
+            self._record(False, elapsed, type(e).__name__)
+            return
+
+        elapsed = time.perf_counter() - start
+        # Cualquier respuesta que no sea un error del servidor indica que el endpoint está en pie
+        healthy = response.status_code < 500
+        agent_client.record_response_metrics("probe", response, start, error=None if healthy else response.reason)
+        self._record(healthy, elapsed, response.status_code)
+
+    def _record(self, healthy, elapsed, status):
+        with self._lock:
+            self.checks.append((time.time(), healthy, elapsed, status))
+            if healthy:
+                self.consecutive_failures = 0
+                self.latency.record(elapsed)
+            else:
+                self.consecutive_failures += 1
+
+    def status(self):
+        with self._lock:
+            checks = list(self.checks)
+            consecutive_failures = self.consecutive_failures
+        if not checks:
+            return {"state": UNKNOWN, "checks": 0}
+
+        checked_at, healthy, elapsed, last_status = checks[-1]
+        availability = sum(check[1] for check in checks) / len(checks)
+        p95 = self.latency.percentile(0.95)
+        if consecutive_failures >= 2 or (not healthy and len(checks) == 1):
+            state = DOWN
+        elif not healthy or availability < 0.9 or (p95 is not None and p95 > HEALTH_SLOW_THRESHOLD):
+            state = DEGRADED
+        else:
+            state = AVAILABLE
+        return {
+            "state": state,
+            "checks": len(checks),
+            "availability": availability,
+            "latency_p50": self.latency.percentile(0.5),
+            "latency_p95": p95,
+            "last_latency": elapsed,
+            "last_status": last_status,
+            "last_checked": checked_at,
+            "consecutive_failures": consecutive_failures,
+            "skipped": self.skipped
+        }
+
+
+# Un monitor por endpoint y proceso (no por sesión)
+@st.cache_resource
+def get_health_monitor(agent_endpoint):
+    return HealthMonitor(agent_endpoint, scheduler=get_scheduler())
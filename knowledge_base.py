@@ -0,0 +1,144 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+import streamlit as st
+
+import metrics
+from response_cache import normalize_prompt
+
+# Corpus curado de preguntas frecuentes y políticas (variables de entorno).
+# Formato: lista JSON de {"id", "questions": [variantes de la pregunta], "answer": texto en markdown}
+KB_PATH = os.environ.get(
+    "TAMPA_KB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.json")
+)
+# Confianza mínima (0-1) para responder localmente sin consultar al asistente
+KB_THRESHOLD = float(os.environ.get("TAMPA_KB_THRESHOLD", "0.8"))
+
+# Parámetros de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a al algo como con cual cuales cuando de del donde el en es esa ese eso esta este esto ha hay la las le les lo los
+me mi mis o para pero por puedo que quien se si sin su sus te tengo tiene un una uno unos unas y ya yo
+""".split())
+
+
+# Reducir plurales para que "números" y "número" coincidan
+def stem(word):
+    if len(word) > 5 and word.endswith("ones"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in normalize_prompt(text).split() if word not in STOPWORDS]
+
+
+# Índice BM25 sobre las variantes de las preguntas del corpus.
+# La confianza es la fracción (ponderada por IDF) de los términos de la consulta que aparecen
+# en la mejor variante; los términos desconocidos pesan como los más raros del corpus.
+class KnowledgeBase:
+    def __init__(self, entries, threshold=KB_THRESHOLD):
+        self.entries = entries
+        self.threshold = threshold
+        self.lookups = 0
+        self.matches = 0
+        self.total_time = 0.0
+        self._lock = threading.Lock()
+
+        self._docs = []  # (índice de la entrada, términos de la variante, longitud)
+        self._postings = defaultdict(list)  # término -> [(documento, frecuencia)]
+        for entry_index, entry in enumerate(entries):
+            for question in entry["questions"]:
+                terms = tokenize(question)
+                if not terms:
+                    continue
+                doc_index = len(self._docs)
+                self._docs.append((entry_index, frozenset(terms), len(terms)))
+                for term, count in Counter(terms).items():
+                    self._postings[term].append((doc_index, count))
+
+        doc_count = len(self._docs)
+        self._avg_length = sum(length for _, _, length in self._docs) / doc_count if doc_count else 0.0
+        self._idf = {
+            term: math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+        self._unknown_idf = math.log(1 + (doc_count + 0.5) / 0.5)
+
+    @classmethod
+    def load(cls, path=KB_PATH, threshold=KB_THRESHOLD):
+        try:
+            with open(path, encoding="utf-8") as kb_file:
+                entries = json.load(kb_file)
+        except (OSError, ValueError):
+            entries = []
+        return cls(entries, threshold)
+
+    # Mejor entrada para la consulta: (entrada, confianza) o (None, 0)
+    def search(self, text):
+        terms = tokenize(text)
+        if not terms or not self._docs:
+            return None, 0.0
+
+        scores = defaultdict(float)
+        for term, query_count in Counter(terms).items():
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_index, count in self._postings[term]:
+                length = self._docs[doc_index][2]
+                norm = count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * length / self._avg_length))
+                scores[doc_index] += idf * norm * query_count
+        if not scores:
+            return None, 0.0
+
+        best_doc = max(scores, key=scores.get)
+        entry_index, doc_terms, _ = self._docs[best_doc]
+        unique_terms = set(terms)
+        weights = {term: self._idf.get(term, self._unknown_idf) for term in unique_terms}
+        confidence = sum(weight for term, weight in weights.items() if term in doc_terms) / sum(weights.values())
+        return self.entries[entry_index], confidence
+
+    # Responder localmente si la confianza supera el umbral; registra la tasa de aciertos
+    def lookup(self, text, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        start = time.perf_counter()
+        entry, confidence = self.search(text)
+        elapsed = time.perf_counter() - start
+        matched = entry is not None and confidence >= threshold
+
+        with self._lock:
+            self.lookups += 1
+            self.matches += matched
+            self.total_time += elapsed
+        metrics.registry.record("kb", status="match" if matched else "miss", total=elapsed)
+
+        if not matched:
+            return None
+        return {"id": entry["id"], "answer": entry["answer"], "confidence": confidence, "elapsed": elapsed}
+
+    def stats(self):
+        with self._lock:
+            lookups, matches, total_time = self.lookups, self.matches, self.total_time
+        return {
+            "entries": len(self.entries),
+            "lookups": lookups,
+            "matches": matches,
+            "match_rate": matches / lookups if lookups else 0.0,
+            "avg_ms": total_time / lookups * 1000 if lookups else 0.0
+        }
+
+
+# Índice cargado una vez por proceso
+@st.cache_resource
+def get_knowledge_base():
+    return KnowledgeBase.load()
@@ -0,0 +1,303 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Registro JSONL de cada solicitud ("" lo desactiva)
+METRICS_LOG = os.environ.get(
+    "TAMPA_METRICS_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "metrics.jsonl")
+)
+# Puerto del endpoint de métricas estilo Prometheus (vacío = desactivado)
+METRICS_PORT = os.environ.get("TAMPA_METRICS_PORT", "")
+# Tamaño máximo del registro JSONL antes de rotarlo (MB) y copias rotadas que se conservan
+METRICS_LOG_MAX_MB = float(os.environ.get("TAMPA_METRICS_LOG_MAX_MB", "10"))
+METRICS_LOG_BACKUPS = 3
+# Registros pendientes de escribir como máximo (si el disco no da abasto se descartan)
+METRICS_LOG_QUEUE = 10000
+# Solicitudes recientes que se guardan en memoria para el panel, por tipo: los reruns
+# frecuentes no desplazan a las muestras de las consultas al asistente
+METRICS_WINDOW = int(os.environ.get("TAMPA_METRICS_WINDOW", "2000"))
+
+# Cuantiles publicados en el endpoint de métricas
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# --- Tiempos de conexión (DNS / TCP / TLS) ---------------------------------
+
+# Cada hilo guarda los tiempos de la última conexión que abrió
+_connection_timings = threading.local()
+
+
+def reset_connection_timings():
+    _connection_timings.values = {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+
+
+# Devuelve los tiempos de conexión del hilo actual (0 si se reutilizó una conexión keep-alive)
+def pop_connection_timings():
+    values = getattr(_connection_timings, "values", None) or {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+    reset_connection_timings()
+    return values
+
+
+def _timings():
+    if getattr(_connection_timings, "values", None) is None:
+        reset_connection_timings()
+    return _connection_timings.values
+
+
+class _TimedConnectionMixin:
+    # Medir el DNS con una resolución aparte y conectar por el nombre del host, como urllib3:
+    # así se prueban todas las direcciones (p. ej. IPv4 si IPv6 no responde). La conexión
+    # vuelve a resolver el nombre; su tiempo se estima restando el de la resolución medida.
+    def _new_conn(self):
+        timings = _timings()
+        start = time.perf_counter()
+        try:
+            socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            pass
+        resolved = time.perf_counter()
+        timings["dns"] = resolved - start
+
+        sock = super()._new_conn()
+        end = time.perf_counter()
+        timings["connect"] = max(0.0, end - resolved - timings["dns"])
+        # Duración total de _new_conn (incluida la resolución medida aparte), para calcular el TLS
+        self._new_conn_elapsed = end - start
+        return sock
+
+    def connect(self):
+        timings = _timings()
+        self._new_conn_elapsed = 0.0
+        start = time.perf_counter()
+        super().connect()
+        # En HTTPS, lo que no es abrir el socket (DNS y TCP) es el handshake TLS
+        elapsed = time.perf_counter() - start
+        timings["tls"] = max(0.0, elapsed - self._new_conn_elapsed) if self.scheme == "https" else 0.0
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    scheme = "http"
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    scheme = "https"
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+# Adaptador de requests que mide DNS, conexión TCP y TLS de cada conexión nueva
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool
+        }
+
+
+# --- Registro de métricas ---------------------------------------------------
+
+# kind: "chat" (sin streaming), "stream", "probe", "turn" (turno completo visto por el usuario)
+# "startup"/"rerun" (tiempo de render de la página), "kb" (búsqueda local, status "match"/"miss")
+# "tts" (síntesis de una frase, status = motor de voz) o "prefetch" (precarga de una pregunta siguiente)
+def make_record(kind, status=None, total=0.0, ttfb=None, ttft=None, dns=0.0, connect=0.0, tls=0.0,
+                request_bytes=0, response_bytes=0, prompt_tokens=None, completion_tokens=None,
+                cache_hit=False, error=None):
+    return {
+        "ts": time.time(),
+        "kind": kind,
+        "status": status,
+        "dns": dns,
+        "connect": connect,
+        "tls": tls,
+        "ttfb": ttfb,
+        "ttft": ttft,
+        "total": total,
+        "request_bytes": request_bytes,
+        "response_bytes": response_bytes,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cache_hit": cache_hit,
+        "error": error
+    }
+
+
+def _quantile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+# Registro compartido por todo el proceso. Es un objeto de módulo (y no st.cache_resource)
+# porque se escribe desde los hilos del despachador, que no tienen contexto de Streamlit.
+class MetricsRegistry:
+    def __init__(self, window=METRICS_WINDOW, log_path=METRICS_LOG, log_max_bytes=METRICS_LOG_MAX_MB * 1024 * 1024):
+        self.window = window
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.dropped = 0
+        self._records = defaultdict(lambda: deque(maxlen=self.window))  # kind -> registros recientes
+        self._counters = defaultdict(float)
+        self._durations = defaultdict(lambda: [0.0, 0])  # kind -> [suma, cantidad]
+        self._lock = threading.Lock()
+        self._log_queue = queue.Queue(maxsize=METRICS_LOG_QUEUE)
+        self._writer = None
+
+    def record(self, kind, **fields):
+        entry = make_record(kind, **fields)
+        with self._lock:
+            self._records[kind].append(entry)
+            status = str(entry["status"]) if entry["status"] is not None else ("error" if entry["error"] else "ok")
+            self._counters[("requests", kind, status)] += 1
+            self._counters[("bytes_sent", kind)] += entry["request_bytes"]
+            self._counters[("bytes_received", kind)] += entry["response_bytes"]
+            self._counters[("tokens", "prompt")] += entry["prompt_tokens"] or 0
+            self._counters[("tokens", "completion")] += entry["completion_tokens"] or 0
+            if entry["cache_hit"]:
+                self._counters[("cache_hits",)] += 1
+            durations = self._durations[kind]
+            durations[0] += entry["total"]
+            durations[1] += 1
+            if self.log_path and self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+                self._writer.start()
+        if self.log_path:
+            # La escritura en disco la hace un hilo aparte, fuera del lock y del hilo del script
+            try:
+                self._log_queue.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+        return entry
+
+    def _write_loop(self):
+        while True:
+            batch = [self._log_queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except OSError:
+                pass
+            finally:
+                for _ in batch:
+                    self._log_queue.task_done()
+
+    def _write_batch(self, batch):
+        os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.log_max_bytes:
+            self._rotate()
+        with open(self.log_path, "a", encoding="utf-8") as log_file:
+            log_file.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in batch))
+
+    # metrics.jsonl -> metrics.jsonl.1 -> ... -> metrics.jsonl.N (la más antigua se borra)
+    def _rotate(self):
+        for index in range(METRICS_LOG_BACKUPS - 1, 0, -1):
+            older = f"{self.log_path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.log_path}.{index + 1}")
+        os.replace(self.log_path, f"{self.log_path}.1")
+
+    # Esperar a que se escriban los registros pendientes
+    def flush(self):
+        self._log_queue.join()
+
+    # Registros recientes de todos los tipos, en orden cronológico
+    def snapshot(self):
+        with self._lock:
+            records = [entry for entries in self._records.values() for entry in entries]
+        return sorted(records, key=lambda entry: entry["ts"])
+
+    # Texto en formato de exposición de Prometheus
+    def prometheus_text(self):
+        records = self.snapshot()
+        with self._lock:
+            counters = dict(self._counters)
+            durations = {kind: tuple(values) for kind, values in self._durations.items()}
+
+        lines = [
+            "# HELP tampa_agent_requests_total Solicitudes al asistente por tipo y estado.",
+            "# TYPE tampa_agent_requests_total counter"
+        ]
+        for key, value in sorted(counters.items()):
+            if key[0] == "requests":
+                lines.append(f'tampa_agent_requests_total{{kind="{key[1]}",status="{key[2]}"}} {value:g}')
+
+        for name, help_text in (("bytes_sent", "Bytes enviados al asistente."), ("bytes_received", "Bytes recibidos del asistente.")):
+            lines.append(f"# HELP tampa_agent_{name}_total {help_text}")
+            lines.append(f"# TYPE tampa_agent_{name}_total counter")
+            for key, value in sorted(counters.items()):
+                if key[0] == name:
+                    lines.append(f'tampa_agent_{name}_total{{kind="{key[1]}"}} {value:g}')
+
+        lines.append("# HELP tampa_agent_tokens_total Tokens informados por el asistente.")
+        lines.append("# TYPE tampa_agent_tokens_total counter")
+        for token_type in ("prompt", "completion"):
+            lines.append(f'tampa_agent_tokens_total{{type="{token_type}"}} {counters.get(("tokens", token_type), 0):g}')
+
+        lines.append("# HELP tampa_agent_cache_hits_total Respuestas servidas desde la caché.")
+        lines.append("# TYPE tampa_agent_cache_hits_total counter")
+        lines.append(f"tampa_agent_cache_hits_total {counters.get(('cache_hits',), 0):g}")
+
+        lines.append("# HELP tampa_agent_request_duration_seconds Duración total de las solicitudes recientes.")
+        lines.append("# TYPE tampa_agent_request_duration_seconds summary")
+        by_kind = defaultdict(list)
+        for entry in records:
+            by_kind[entry["kind"]].append(entry["total"])
+        for kind in sorted(durations):
+            values = sorted(by_kind.get(kind, []))
+            for q in QUANTILES:
+                lines.append(f'tampa_agent_request_duration_seconds{{kind="{kind}",quantile="{q}"}} {_quantile(values, q):.6f}')
+            total, count = durations[kind]
+            lines.append(f'tampa_agent_request_duration_seconds_sum{{kind="{kind}"}} {total:.6f}')
+            lines.append(f'tampa_agent_request_duration_seconds_count{{kind="{kind}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# --- Endpoint /metrics --------------------------------------------------------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Servir /metrics en un hilo aparte (una sola vez por proceso)
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    return server
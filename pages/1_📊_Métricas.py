@@ -0,0 +1,143 @@
+import streamlit as st
+import json
+import pandas as pd
+import metrics
+from conversation_store import get_conversation_store
+from session_memory import SESSION_IDLE_TTL, SESSION_MAX_MESSAGES, get_session_registry
+
+st.set_page_config(
+    page_title="Métricas Tampa Clean",
+    page_icon="📊",
+    layout="wide",
+    initial_sidebar_state="collapsed",
+    menu_items=None
+)
+
+st.title("📊 Métricas del Asistente Tampa Clean")
+
+# Solo para usuarios que ya ingresaron su clave de acceso
+if not st.session_state.get("is_configured"):
+    st.info("🔐 Ingresa tu clave de acceso en la página de inicio para ver las métricas.")
+    st.stop()
+
+# Memoria de las sesiones activas del proceso
+session_registry = get_session_registry()
+session_rows = session_registry.report()
+with st.expander(f"🧠 Memoria por sesión ({len(session_rows)} activas)"):
+    if session_rows:
+        sessions_df = pd.DataFrame(session_rows)
+        total_bytes = int(sessions_df["history_bytes"].sum() + sessions_df["buffer_bytes"].sum())
+        st.caption(
+            f"Total ~{total_bytes / 1024:.0f} KiB · hasta {SESSION_MAX_MESSAGES} mensajes en memoria por sesión · "
+            f"liberadas por inactividad (> {SESSION_IDLE_TTL / 60:.0f} min): {session_registry.evicted}"
+        )
+        st.dataframe(sessions_df.round({"idle_s": 0}), use_container_width=True, hide_index=True)
+    else:
+        st.caption("Sin sesiones registradas.")
+
+# Mensajes que el almacén de conversaciones no pudo guardar (tras reintentar)
+conversation_store = get_conversation_store()
+if conversation_store.dropped:
+    st.warning(f"⚠️ {conversation_store.dropped} mensajes no se pudieron guardar en el almacén de conversaciones. "
+               f"Último error: {conversation_store.last_error}")
+
+records = metrics.registry.snapshot()
+if not records:
+    st.info("💡 Aún no hay solicitudes registradas en este proceso.")
+    st.stop()
+
+df = pd.DataFrame(records)
+df["ts"] = pd.to_datetime(df["ts"], unit="s")
+# Códigos HTTP y estados de la base de conocimiento ("match"/"miss") en la misma columna
+df["status"] = df["status"].astype("string")
+
+# Etiquetas de los tipos de solicitud
+KIND_LABELS = {
+    "turn": "Turno completo (usuario)",
+    "chat": "Agente sin streaming",
+    "stream": "Agente en streaming",
+    "probe": "Prueba de conexión",
+    "startup": "Primera carga de la página",
+    "rerun": "Rerun de la página",
+    "kb": "Base de conocimiento local",
+    "tts": "Síntesis de voz (por frase)",
+    "prefetch": "Precarga de preguntas siguientes"
+}
+
+col1, col2 = st.columns(2)
+with col1:
+    kinds = st.multiselect(
+        "Tipo de solicitud",
+        options=sorted(df["kind"].unique()),
+        default=[kind for kind in ("turn",) if kind in set(df["kind"])] or sorted(df["kind"].unique()),
+        format_func=lambda kind: KIND_LABELS.get(kind, kind)
+    )
+with col2:
+    window = st.slider("Ventana móvil (solicitudes)", min_value=5, max_value=500, value=50, step=5,
+                       help="Número de solicitudes usadas para calcular los percentiles móviles.")
+
+selected = df[df["kind"].isin(kinds)].sort_values("ts")
+if selected.empty:
+    st.warning("⚠️ No hay solicitudes del tipo seleccionado")
+    st.stop()
+
+# Indicadores generales
+p50, p95, p99 = selected["total"].quantile([0.5, 0.95, 0.99])
+errors = selected["error"].notna().mean()
+turns = df[df["kind"] == "turn"]
+cache_rate = turns["cache_hit"].mean() if not turns.empty else 0.0
+
+m1, m2, m3, m4, m5 = st.columns(5)
+m1.metric("p50", f"{p50:.2f} s")
+m2.metric("p95", f"{p95:.2f} s")
+m3.metric("p99", f"{p99:.2f} s")
+m4.metric("Errores", f"{errors:.1%}")
+m5.metric("Aciertos de caché", f"{cache_rate:.0%}")
+
+# Percentiles móviles de la duración total
+st.markdown("### ⏱️ Latencia total (percentiles móviles)")
+rolling = selected.set_index("ts")["total"].rolling(window, min_periods=1)
+st.line_chart(pd.DataFrame({
+    "p50": rolling.quantile(0.5),
+    "p95": rolling.quantile(0.95),
+    "p99": rolling.quantile(0.99)
+}))
+
+# Desglose de tiempos de red de las llamadas al agente
+upstream = df[df["kind"].isin(["chat", "stream", "probe"])]
+if not upstream.empty:
+    st.markdown("### 🌐 Desglose de tiempos hacia el agente (promedio, segundos)")
+    st.dataframe(
+        upstream.groupby("kind")[["dns", "connect", "tls", "ttfb", "ttft", "total"]].mean().rename(index=KIND_LABELS),
+        use_container_width=True
+    )
+
+    st.markdown("### 📦 Tamaños y tokens")
+    st.dataframe(
+        upstream.groupby("kind").agg(
+            solicitudes=("total", "size"),
+            bytes_enviados=("request_bytes", "mean"),
+            bytes_recibidos=("response_bytes", "mean"),
+            tokens_prompt=("prompt_tokens", "mean"),
+            tokens_respuesta=("completion_tokens", "mean")
+        ).rename(index=KIND_LABELS),
+        use_container_width=True
+    )
+
+# Últimas solicitudes
+with st.expander("📋 Últimas solicitudes"):
+    st.dataframe(df.sort_values("ts", ascending=False).head(100), use_container_width=True)
+
+# Exportar
+st.download_button(
+    label="📥 Descargar métricas (Prometheus)",
+    data=metrics.registry.prometheus_text(),
+    file_name="metricas_tampa_clean.prom",
+    mime="text/plain"
+)
+st.download_button(
+    label="📥 Descargar solicitudes (JSONL)",
+    data="\n".join(json.dumps(record, ensure_ascii=False) for record in records),
+    file_name="solicitudes_tampa_clean.jsonl",
+    mime="application/json"
+)
@@ -0,0 +1,111 @@
+import streamlit as st
+import hashlib
+import os
+import pandas as pd
+from batch_qa import BATCH_CONCURRENCY, BATCH_DIR, BatchRunner, completed_ids, read_prompts, read_results
+from dispatcher import MAX_UPSTREAM_CONCURRENCY, get_dispatcher
+from response_cache import get_response_cache
+from scheduler import get_scheduler
+
+st.set_page_config(
+    page_title="Preguntas por lote Tampa Clean",
+    page_icon="📝",
+    layout="wide",
+    initial_sidebar_state="collapsed",
+    menu_items=None
+)
+
+st.title("📝 Preguntas por lote")
+
+# Solo para usuarios que ya ingresaron su clave de acceso
+if not st.session_state.get("is_configured"):
+    st.info("🔐 Ingresa tu clave de acceso en la página de inicio para usar el modo por lotes.")
+    st.stop()
+
+st.markdown(
+    "Sube un archivo **CSV** (columna `prompt`, `question` o `pregunta`; `id` opcional) o **JSONL** "
+    "con una pregunta por línea. Las respuestas se guardan a medida que llegan: si la ejecución se "
+    "interrumpe, al volver a ejecutarla solo se envían las preguntas pendientes."
+)
+
+uploaded = st.file_uploader("📤 Archivo de preguntas", type=["csv", "jsonl"])
+if uploaded is None:
+    st.stop()
+
+data = uploaded.getvalue()
+try:
+    prompts = read_prompts(data, "jsonl" if uploaded.name.endswith(".jsonl") else "csv")
+except ValueError as e:
+    st.error(f"❌ No se pudo leer el archivo: {e}")
+    st.stop()
+
+if not prompts:
+    st.warning("⚠️ El archivo no contiene preguntas")
+    st.stop()
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    concurrency = st.slider("🔀 Preguntas en paralelo", min_value=1, max_value=MAX_UPSTREAM_CONCURRENCY,
+                            value=min(BATCH_CONCURRENCY, MAX_UPSTREAM_CONCURRENCY))
+with col2:
+    temperature = st.slider("🌡️ Temperatura", min_value=0.0, max_value=1.0, value=0.2, step=0.1)
+with col3:
+    max_tokens = st.slider("📏 Longitud máxima", min_value=100, max_value=2000, value=1000, step=100)
+warm_cache = st.checkbox("📦 Guardar las respuestas en la caché del chat", value=True,
+                         help="Las preguntas del lote se responderán al instante en el chat.")
+
+# Mismo archivo y parámetros -> mismo archivo de resultados (así se puede reanudar)
+digest = hashlib.sha256(data + f"|{temperature:.2f}|{max_tokens}".encode("utf-8")).hexdigest()[:16]
+output_path = os.path.join(BATCH_DIR, f"{digest}.jsonl")
+done = len(completed_ids(output_path) & {item["id"] for item in prompts})
+
+st.caption(f"{len(prompts)} preguntas · {done} ya respondidas")
+restart = st.checkbox("🔁 Empezar de cero (descartar las respuestas anteriores)", value=False) if done else False
+
+if st.button("▶️ Reanudar" if done and not restart else "▶️ Ejecutar", type="primary"):
+    runner = BatchRunner(
+        get_dispatcher(),
+        st.session_state.agent_endpoint,
+        st.session_state.agent_access_key,
+        temperature=temperature,
+        max_tokens=max_tokens,
+        concurrency=concurrency,
+        scheduler=get_scheduler(),
+        response_cache=get_response_cache() if warm_cache else None
+    )
+    completed = 0 if restart else done
+    errors = 0
+    progress = st.progress(completed / len(prompts), text="Enviando preguntas...")
+    latest = st.empty()
+    for result in runner.run(prompts, output_path, resume=not restart):
+        completed += 1
+        errors += bool(result["error"])
+        progress.progress(min(1.0, completed / len(prompts)), text=f"{completed} de {len(prompts)} · errores: {errors}")
+        latest.caption(f"{'❌' if result['error'] else '✅'} {result['prompt'][:100]}")
+    latest.empty()
+    if errors:
+        st.warning(f"⚠️ {errors} preguntas fallaron. Vuelve a ejecutar el lote para reintentarlas.")
+    else:
+        st.success("✅ Lote completado")
+
+results = read_results(output_path)
+if results:
+    # Última respuesta de cada pregunta (los reintentos añaden filas nuevas)
+    df = pd.DataFrame(results).drop_duplicates("id", keep="last")
+    st.dataframe(df[["id", "prompt", "response", "error", "latency"]], use_container_width=True, hide_index=True)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "📥 Descargar JSONL",
+            data=df.to_json(orient="records", lines=True, force_ascii=False),
+            file_name="respuestas_tampa_clean.jsonl",
+            mime="application/jsonl"
+        )
+    with col2:
+        st.download_button(
+            "📥 Descargar CSV",
+            data=df.to_csv(index=False).encode("utf-8"),
+            file_name="respuestas_tampa_clean.csv",
+            mime="text/csv"
+        )
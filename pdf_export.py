@@ -0,0 +1,145 @@
+import copy
+import hashlib
+import os
+from datetime import datetime
+
+import fpdf
+from fpdf import FPDF
+
+# Fuente TrueType con soporte Unicode (DejaVu Sans por defecto si está instalada)
+PDF_FONT_CANDIDATES = [
+    os.environ.get("TAMPA_PDF_FONT", ""),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+
+# Las métricas de la fuente se guardan en .cache/fonts y no junto al archivo TTF
+FONT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "fonts")
+
+
+def find_unicode_font():
+    for path in PDF_FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+# Variantes en negrita/cursiva siguiendo la convención de nombres de DejaVu
+def font_variant(path, suffixes):
+    base, ext = os.path.splitext(path)
+    for suffix in suffixes:
+        candidate = f"{base}{suffix}{ext}"
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def message_digest(messages):
+    digest = hashlib.sha256()
+    for msg in messages:
+        digest.update(msg["role"].encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(msg["content"].encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# Documento PDF que se construye de forma incremental: cada exportación solo
+# dibuja los mensajes nuevos desde la anterior
+class ConversationPDF:
+    def __init__(self, font_path=None):
+        self.count = 0
+        self.digest = message_digest([])
+        self.pdf = FPDF()
+        self.unicode = bool(font_path)
+
+        if self.unicode:
+            os.makedirs(FONT_CACHE_DIR, exist_ok=True)
+            fpdf.set_global("FPDF_CACHE_MODE", 2)
+            fpdf.set_global("FPDF_CACHE_DIR", FONT_CACHE_DIR)
+            self.pdf.add_font("Unicode", "", font_path, uni=True)
+            self.pdf.add_font("Unicode", "B", font_variant(font_path, ["-Bold", "bd", "Bold"]), uni=True)
+            self.pdf.add_font("Unicode", "I", font_variant(font_path, ["-Oblique", "-Italic", "i", "Italic"]), uni=True)
+            self.family = "Unicode"
+        else:
+            self.family = "Arial"
+
+        self.pdf.add_page()
+
+        # Añadir título con estilo Tampa Clean
+        self.pdf.set_font(self.family, 'B', 16)
+        self.pdf.cell(200, 10, self.text("Conversación con Asistente Tampa Clean"), ln=True, align='C')
+        self.pdf.ln(10)
+
+        # Añadir información de la empresa
+        self.pdf.set_font(self.family, 'I', 10)
+        self.pdf.cell(200, 5, self.text("Tampa Clean - Servicios de Limpieza Profesional"), ln=True, align='C')
+        self.pdf.cell(200, 5, self.text("Teléfono: (813) 998-4553 | WhatsApp: (813) 365-9970"), ln=True, align='C')
+        self.pdf.ln(10)
+
+    # Adaptar el texto a la fuente: fuera del plano básico Unicode (emojis) o de latin-1 sin fuente TTF
+    def text(self, value):
+        if self.unicode:
+            return "".join(ch if ord(ch) <= 0xFFFF else "?" for ch in value)
+        return value.encode('latin-1', 'replace').decode('latin-1')
+
+    def append(self, messages):
+        pdf = self.pdf
+        for msg in messages:
+            self.count += 1
+            pdf.set_font(self.family, size=12)
+            if msg["role"] == "user":
+                pdf.set_text_color(0, 100, 0)  # Verde para usuario
+                pdf.cell(200, 10, f"Usuario (#{self.count}):", ln=True)
+            else:
+                pdf.set_text_color(0, 0, 150)  # Azul para asistente
+                pdf.cell(200, 10, f"Asistente Tampa Clean (#{self.count}):", ln=True)
+
+            pdf.set_text_color(0, 0, 0)  # Negro para el contenido
+
+            # Partir el texto en múltiples líneas si es necesario
+            pdf.multi_cell(190, 8, self.text(msg["content"]))
+            pdf.ln(5)
+
+        # FPDF añade cada carácter dibujado a la lista "subset" de la fuente, con repeticiones;
+        # compactarla mantiene rápidas la copia y la generación del subconjunto de la fuente
+        if self.unicode:
+            for font in pdf.fonts.values():
+                if "subset" in font:
+                    font["subset"] = list(dict.fromkeys(font["subset"]))
+
+    # Generar los bytes del PDF sin cerrar el documento incremental
+    def render(self):
+        # Las tablas de anchos de las fuentes no cambian: se comparten en la copia
+        memo = {id(font["cw"]): font["cw"] for font in self.pdf.fonts.values() if "cw" in font}
+        snapshot = copy.deepcopy(self.pdf, memo)
+
+        snapshot.set_font(self.family, 'I', 10)
+        snapshot.set_text_color(108, 117, 125)
+        snapshot.cell(200, 10, f"Generado el: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}", ln=True)
+
+        return snapshot.output(dest='S').encode('latin-1')
+
+
+# Exportar la conversación a PDF en memoria.
+# "state" es un dict de la sesión que guarda el documento incremental y el último resultado.
+def export_conversation_pdf(messages, state):
+    digest = message_digest(messages)
+    if state.get("digest") == digest:
+        return state["data"]
+
+    builder = state.get("builder")
+    # Reutilizar el documento si los mensajes ya dibujados no han cambiado
+    if builder is None or builder.count > len(messages) or message_digest(messages[:builder.count]) != builder.digest:
+        builder = ConversationPDF(find_unicode_font())
+
+    builder.append(messages[builder.count:])
+    builder.digest = digest
+
+    state["builder"] = builder
+    state["digest"] = digest
+    state["data"] = builder.render()
+    return state["data"]
@@ -0,0 +1,237 @@
+import concurrent.futures
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+import streamlit as st
+
+import metrics
+from conversation_store import get_conversation_store
+from dispatcher import get_dispatcher
+from response_cache import get_response_cache, normalize_prompt, similarity, trigrams
+from scheduler import PRIORITY_BACKGROUND, QueueTimeout, get_scheduler
+
+# Configuración de la precarga de preguntas siguientes (variables de entorno)
+PREFETCH_ENABLED = os.environ.get("TAMPA_PREFETCH", "1") == "1"
+# Preguntas siguientes que se precargan tras cada respuesta
+PREFETCH_TOP_K = int(os.environ.get("TAMPA_PREFETCH_TOP_K", "2"))
+# Veces que se debe haber visto una transición y probabilidad mínima para precargarla
+PREFETCH_MIN_COUNT = int(os.environ.get("TAMPA_PREFETCH_MIN_COUNT", "2"))
+PREFETCH_MIN_PROBABILITY = float(os.environ.get("TAMPA_PREFETCH_MIN_PROBABILITY", "0.2"))
+# Tope del tráfico de precarga como fracción de las consultas reales al asistente
+PREFETCH_BUDGET = float(os.environ.get("TAMPA_PREFETCH_BUDGET", "0.2"))
+# Cada cuánto se leen del almacén las conversaciones nuevas (segundos)
+PREFETCH_REFRESH_INTERVAL = float(os.environ.get("TAMPA_PREFETCH_REFRESH", "300"))
+# Similitud mínima para usar las transiciones de una pregunta casi idéntica
+PREFETCH_SIMILARITY = 0.85
+# Espera máxima en la cola del planificador: si el chat está ocupado, la precarga se descarta
+PREFETCH_MAX_WAIT = 5.0
+
+# Precargas pendientes como máximo: si el hilo va atrasado, las nuevas se descartan
+PREFETCH_MAX_QUEUED = 4
+
+# Conversaciones recientes de las que se recuerda la última pregunta (para enlazar lecturas incrementales)
+MAX_TRACKED_CONVERSATIONS = 10000
+
+
+# Modelo de transiciones entre preguntas consecutivas de una misma conversación, aprendido
+# del almacén de conversaciones. Solo propone preguntas que alguien ya hizo como primera
+# pregunta de una conversación: se entienden sin contexto y suelen repetirse literalmente.
+class FollowUpModel:
+    def __init__(self):
+        self.transitions = defaultdict(Counter)  # pregunta normalizada -> Counter(siguiente normalizada)
+        self.openers = set()  # preguntas normalizadas hechas sin contexto previo
+        self.texts = {}  # pregunta normalizada -> texto original más reciente
+        self.last_id = 0
+        self._grams = {}  # pregunta normalizada con transiciones -> trigramas
+        self._previous = OrderedDict()  # conversación -> última pregunta normalizada
+        self._lock = threading.Lock()
+
+    # Incorporar preguntas nuevas [(id, conversation_id, seq, content)] en orden de inserción
+    def learn(self, rows):
+        with self._lock:
+            for row_id, conversation_id, seq, content in rows:
+                normalized = normalize_prompt(content)
+                self.last_id = max(self.last_id, row_id)
+                if not normalized:
+                    continue
+                self.texts[normalized] = content.strip()
+                if seq == 1:
+                    self.openers.add(normalized)
+                previous = self._previous.pop(conversation_id, None)
+                if previous is not None and previous != normalized:
+                    self.transitions[previous][normalized] += 1
+                    self._grams.setdefault(previous, trigrams(previous))
+                self._previous[conversation_id] = normalized
+                if len(self._previous) > MAX_TRACKED_CONVERSATIONS:
+                    self._previous.popitem(last=False)
+
+    # Preguntas siguientes más probables: [(texto, probabilidad)]
+    def predict(self, prompt, k=PREFETCH_TOP_K, min_count=PREFETCH_MIN_COUNT, min_probability=PREFETCH_MIN_PROBABILITY):
+        normalized = normalize_prompt(prompt)
+        with self._lock:
+            counts = self.transitions.get(normalized)
+            if counts is None:
+                # Pregunta casi idéntica a una conocida (otra redacción de la misma pregunta)
+                grams = trigrams(normalized)
+                best, best_score = None, PREFETCH_SIMILARITY
+                for other, other_grams in self._grams.items():
+                    score = similarity(grams, other_grams)
+                    if score >= best_score:
+                        best, best_score = other, score
+                counts = self.transitions.get(best) if best else None
+            if not counts:
+                return []
+            total = sum(counts.values())
+            return [
+                (self.texts[candidate], count / total)
+                for candidate, count in counts.most_common()
+                if candidate in self.openers and count >= min_count and count / total >= min_probability
+            ][:k]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prompts": len(self.transitions),
+                "transitions": sum(len(counts) for counts in self.transitions.values()),
+                "openers": len(self.openers)
+            }
+
+
+# Tope de la precarga: cada consulta real al asistente da "fraction" créditos y cada
+# precarga gasta uno, de modo que el tráfico de precarga nunca supera esa fracción
+# del tráfico real (más una pequeña reserva de "burst" precargas).
+class PrefetchBudget:
+    def __init__(self, fraction=PREFETCH_BUDGET, burst=PREFETCH_TOP_K):
+        self.fraction = fraction
+        self.burst = max(1.0, float(burst))
+        self.credits = 0.0
+        self.real = 0
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def record_real(self):
+        with self._lock:
+            self.real += 1
+            self.credits = min(self.burst, self.credits + self.fraction)
+
+    def try_spend(self):
+        with self._lock:
+            if self.credits < 1.0:
+                return False
+            self.credits -= 1.0
+            self.spent += 1
+            return True
+
+
+# Precarga especulativa: tras cada respuesta, consulta en segundo plano (prioridad baja en el
+# planificador) las preguntas siguientes más probables con el historial que tendrá el próximo
+# turno y guarda sus respuestas en la caché bajo ese historial.
+# Los objetos compartidos se reciben ya creados: el hilo de precarga no tiene contexto de Streamlit.
+class Prefetcher:
+    def __init__(self, store, dispatcher, scheduler, response_cache, model=None, budget=None,
+                 refresh_interval=PREFETCH_REFRESH_INTERVAL):
+        self.store = store
+        self.dispatcher = dispatcher
+        self.scheduler = scheduler
+        self.response_cache = response_cache
+        self.model = model or FollowUpModel()
+        self.budget = budget or PrefetchBudget()
+        self.refresh_interval = refresh_interval
+        self.issued = 0
+        self.skipped_budget = 0
+        self.failed = 0
+        self.used = 0
+        self._prefetched = OrderedDict()  # preguntas normalizadas precargadas y aún no usadas
+        self._queued = 0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+        # Un solo hilo: la precarga nunca compite consigo misma por el agente
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._executor.submit(self.refresh)
+
+    # Leer del almacén las preguntas guardadas desde la última lectura
+    def refresh(self):
+        self._last_refresh = time.monotonic()
+        while True:
+            rows = self.store.user_prompts(self.model.last_id)
+            if not rows:
+                break
+            self.model.learn(rows)
+
+    # Consulta real al asistente (da crédito a la precarga)
+    def record_request(self):
+        self.budget.record_real()
+
+    # La pregunta del usuario se respondió desde la caché: ¿la había precargado la precarga?
+    def note_cache_hit(self, prompt):
+        with self._lock:
+            if self._prefetched.pop(normalize_prompt(prompt), None) is not None:
+                self.used += 1
+
+    # Programar la precarga de las preguntas que suelen seguir a "prompt" (no bloquea).
+    # "history" es el contexto que se enviará en el próximo turno de la conversación.
+    def schedule(self, prompt, history, agent_endpoint, agent_access_key, temperature, max_tokens):
+        with self._lock:
+            if self._queued >= PREFETCH_MAX_QUEUED:
+                return
+            self._queued += 1
+        self._executor.submit(self._run, prompt, history, agent_endpoint, agent_access_key, temperature, max_tokens)
+
+    def _run(self, prompt, history, agent_endpoint, agent_access_key, temperature, max_tokens):
+        try:
+            if time.monotonic() - self._last_refresh >= self.refresh_interval:
+                self.refresh()
+            for candidate, _ in self.model.predict(prompt):
+                if self.response_cache.contains(candidate, temperature, max_tokens, history):
+                    continue
+                if not self.budget.try_spend():
+                    with self._lock:
+                        self.skipped_budget += 1
+                    continue
+                self._prefetch(candidate, history, agent_endpoint, agent_access_key, temperature, max_tokens)
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+    def _prefetch(self, prompt, history, agent_endpoint, agent_access_key, temperature, max_tokens):
+        start = time.perf_counter()
+        try:
+            with self.scheduler.slot("prefetch", PRIORITY_BACKGROUND, timeout=PREFETCH_MAX_WAIT):
+                response = self.dispatcher.query(agent_endpoint, agent_access_key, prompt, history,
+                                                 temperature=temperature, max_tokens=max_tokens)
+        except QueueTimeout as e:
+            response = {"error": str(e)}
+
+        error = response.get("error") or (None if response.get("response") else "Respuesta vacía")
+        metrics.registry.record("prefetch", total=time.perf_counter() - start, error=error)
+        with self._lock:
+            self.issued += 1
+            if error:
+                self.failed += 1
+                return
+            self._prefetched[normalize_prompt(prompt)] = True
+            if len(self._prefetched) > 1000:
+                self._prefetched.popitem(last=False)
+        self.response_cache.put(prompt, temperature, max_tokens, response["response"], history)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "issued": self.issued,
+                "used": self.used,
+                "failed": self.failed,
+                "skipped_budget": self.skipped_budget,
+                "real_requests": self.budget.real,
+                "budget": self.budget.fraction,
+                "hit_rate": self.used / self.issued if self.issued else 0.0
+            }
+        stats.update(self.model.stats())
+        return stats
+
+
+# Precarga única por proceso (el modelo se carga del almacén en segundo plano)
+@st.cache_resource
+def get_prefetcher():
+    return Prefetcher(get_conversation_store(), get_dispatcher(), get_scheduler(), get_response_cache())
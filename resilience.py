@@ -0,0 +1,247 @@
+import concurrent.futures
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import streamlit as st
+
+import agent_client
+
+# Política de reintentos (variables de entorno)
+RETRY_ATTEMPTS = int(os.environ.get("TAMPA_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("TAMPA_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.environ.get("TAMPA_RETRY_MAX_DELAY", "4"))
+# Tiempo total máximo dedicado a una consulta, incluidos los reintentos
+RETRY_TOTAL_BUDGET = float(os.environ.get("TAMPA_RETRY_TOTAL_BUDGET", "90"))
+
+# Circuit breaker
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("TAMPA_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("TAMPA_BREAKER_RESET", "30"))
+
+# Solicitudes "hedged": lanzar una copia si la original supera el p95 de latencia
+HEDGE_REQUESTS = os.environ.get("TAMPA_HEDGE_REQUESTS", "0") == "1"
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.5
+
+# Códigos HTTP que indican un fallo transitorio del servidor
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+# Una consulta interrumpida por una excepción cuenta como fallo en el circuit breaker
+# (así también se libera la solicitud de prueba en semiabierto)
+INTERRUPTED_RESULT = {"error": "La consulta se interrumpió", "transient": True}
+
+
+def is_retryable(result):
+    return bool(result.get("transient")) or result.get("status_code") in RETRYABLE_STATUS_CODES
+
+
+# Espera exponencial con "full jitter"
+def backoff_delay(attempt, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+# Latencias recientes de las consultas correctas (para calcular el p95)
+class LatencyTracker:
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    CLOSED = "cerrado"
+    OPEN = "abierto"
+    HALF_OPEN = "semiabierto"
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    # ¿Se puede enviar una solicitud? En semiabierto solo se permite una de prueba
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def retry_in(self):
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def snapshot(self):
+        return {"state": self.state, "failures": self.failures, "retry_in": self.retry_in()}
+
+
+# Capa de resiliencia alrededor del endpoint: reintentos, hedging y circuit breaker
+class ResilientCaller:
+    def __init__(self, attempts=RETRY_ATTEMPTS, total_budget=RETRY_TOTAL_BUDGET, hedge=HEDGE_REQUESTS):
+        self.attempts = max(1, attempts)
+        self.total_budget = total_budget
+        self.hedge = hedge
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedged = 0
+        self.rejected = 0
+        self._hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="agent-hedge")
+
+    def circuit_open_error(self):
+        self.rejected += 1
+        return {
+            "error": f"El asistente no está disponible temporalmente. Reintento en {self.breaker.retry_in():.0f} s.",
+            "circuit_open": True
+        }
+
+    # Registrar el resultado final de una consulta en el circuit breaker
+    def _settle(self, result):
+        if "error" in result and is_retryable(result):
+            self.breaker.record_failure()
+        else:
+            # El endpoint respondió (aunque sea con un error del cliente): está sano
+            self.breaker.record_success()
+
+    def _can_retry(self, attempt, result, start_time, delay):
+        if attempt + 1 >= self.attempts or not is_retryable(result):
+            return False
+        return time.monotonic() - start_time + delay < self.total_budget
+
+    def _hedge_delay(self):
+        if not self.hedge or len(self.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, self.latency.percentile(0.95))
+
+    # Lanzar una copia de la solicitud si la original tarda más que el p95
+    def _call_hedged(self, call):
+        delay = self._hedge_delay()
+        if delay is None:
+            return call()
+
+        primary = self._hedge_executor.submit(call)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self.hedged += 1
+        secondary = self._hedge_executor.submit(call)
+        result = None
+        for future in concurrent.futures.as_completed([primary, secondary]):
+            result = future.result()
+            if "error" not in result:
+                return result
+        return result
+
+    def query(self, args, session=None):
+        if not self.breaker.allow():
+            return self.circuit_open_error()
+
+        start_time = time.monotonic()
+        completed = False
+        try:
+            for attempt in range(self.attempts):
+                attempt_start = time.monotonic()
+                result = self._call_hedged(lambda: agent_client.request_completion(*args, session=session))
+                if "error" not in result:
+                    self.latency.record(time.monotonic() - attempt_start)
+                    break
+
+                delay = backoff_delay(attempt)
+                if not self._can_retry(attempt, result, start_time, delay):
+                    break
+                self.retries += 1
+                time.sleep(delay)
+            completed = True
+        finally:
+            self._settle(result if completed else INTERRUPTED_RESULT)
+        return result
+
+    # Streaming: solo se reintenta si todavía no se ha recibido ningún token
+    def stream(self, args, session=None, result=None):
+        if result is None:
+            result = {}
+        if not self.breaker.allow():
+            result.update(self.circuit_open_error())
+            return
+
+        start_time = time.monotonic()
+        completed = False
+        try:
+            for attempt in range(self.attempts):
+                attempt_result = {}
+                received_tokens = False
+                for chunk in agent_client.stream_completion(*args, result=attempt_result, session=session):
+                    received_tokens = True
+                    yield chunk
+
+                if "error" not in attempt_result or received_tokens:
+                    break
+
+                delay = backoff_delay(attempt)
+                if not self._can_retry(attempt, attempt_result, start_time, delay):
+                    break
+                self.retries += 1
+                time.sleep(delay)
+            completed = True
+        finally:
+            # También si el generador se cierra antes de terminar (la sesión abandonó el stream)
+            self._settle(attempt_result if completed else INTERRUPTED_RESULT)
+        result.update(attempt_result)
+
+    def stats(self):
+        p95 = self.latency.percentile(0.95)
+        return {
+            "breaker": self.breaker.snapshot(),
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "rejected": self.rejected,
+            "p95": p95
+        }
+
+
+# Estado de resiliencia compartido por todo el proceso
+@st.cache_resource
+def get_resilient_caller():
+    return ResilientCaller()
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import streamlit as st
+
+# Configuración de la caché (variables de entorno)
+CACHE_DIR = os.environ.get("TAMPA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_TTL = int(os.environ.get("TAMPA_CACHE_TTL", str(24 * 60 * 60)))
+CACHE_MAX_ENTRIES = int(os.environ.get("TAMPA_CACHE_MAX_ENTRIES", "512"))
+# Similitud mínima (Jaccard de trigramas) para reutilizar una pregunta casi idéntica; 0 la desactiva
+CACHE_SIMILARITY = float(os.environ.get("TAMPA_CACHE_SIMILARITY", "0.85"))
+
+
+# Normalizar el texto de la pregunta: minúsculas, sin acentos, signos ni emojis
+def normalize_prompt(prompt):
+    text = unicodedata.normalize("NFKD", prompt.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# Huella del historial enviado como contexto: la misma pregunta en otra conversación es otra entrada
+def history_digest(history):
+    if not history:
+        return ""
+    raw = json.dumps(history, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def make_key(prompt, temperature, max_tokens, history=None):
+    key = f"{normalize_prompt(prompt)}|{float(temperature):.2f}|{int(max_tokens)}"
+    digest = history_digest(history)
+    return f"{key}|{digest}" if digest else key
+
+
+# Huella del historial dentro de los parámetros de una clave ("" si es una pregunta sin contexto)
+def params_digest(params):
+    parts = params.split("|")
+    return parts[2] if len(parts) > 2 else ""
+
+
+# Caché LRU con expiración (TTL) en memoria, respaldada en SQLite para sobrevivir a reinicios
+class ResponseCache:
+    def __init__(self, path=None, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, similarity_threshold=CACHE_SIMILARITY):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (response, created_at, trigramas, params)
+        self._lock = threading.Lock()
+        self._db = None
+
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._load()
+
+    def _load(self):
+        now = time.time()
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT key, response, created_at FROM responses ORDER BY created_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        for key, response, created_at in reversed(rows):
+            self._entries[key] = self._entry(key, response, created_at)
+
+    @staticmethod
+    def _entry(key, response, created_at):
+        normalized, _, params = key.partition("|")
+        return (response, created_at, trigrams(normalized), params)
+
+    # Entrada de una clave exacta: de memoria o, si no está, de SQLite (respuestas guardadas por
+    # otro proceso después de cargar la caché, p. ej. batch_qa.py --warm-cache). Con el lock tomado.
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None and self._db:
+            row = self._db.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                entry = self._entry(key, *row)
+                self._remember(key, entry)
+        return entry
+
+    # Añadir una entrada en memoria y desalojar las menos usadas recientemente
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0:
+            self._delete(list(self._entries)[:overflow])
+
+    def _expired(self, created_at, now):
+        return now - created_at > self.ttl
+
+    def _delete(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+        if self._db and keys:
+            self._db.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in keys])
+            self._db.commit()
+
+    def get(self, prompt, temperature, max_tokens, history=None):
+        key = make_key(prompt, temperature, max_tokens, history)
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(key)
+            if entry and not self._expired(entry[1], now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                self._delete([key])
+
+            # Buscar una pregunta casi idéntica con los mismos parámetros (y el mismo historial)
+            if self.similarity_threshold > 0:
+                normalized, _, params = key.partition("|")
+                grams = trigrams(normalized)
+                best_key, best_score = None, self.similarity_threshold
+                for other_key, (_, created_at, other_grams, other_params) in self._entries.items():
+                    if other_params != params or self._expired(created_at, now):
+                        continue
+                    score = similarity(grams, other_grams)
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key:
+                    self._entries.move_to_end(best_key)
+                    self.near_hits += 1
+                    return self._entries[best_key][0]
+
+            self.misses += 1
+            return None
+
+    # ¿Hay una respuesta vigente para esta pregunta exacta? (no cuenta como acierto ni fallo)
+    def contains(self, prompt, temperature, max_tokens, history=None):
+        key = make_key(prompt, temperature, max_tokens, history)
+        with self._lock:
+            entry = self._lookup(key)
+            return entry is not None and not self._expired(entry[1], time.time())
+
+    # Respuesta guardada más parecida con el mismo historial, sin importar la temperatura
+    # ni el límite de tokens (respuesta de emergencia)
+    def closest(self, prompt, min_similarity=CACHE_SIMILARITY, history=None):
+        grams = trigrams(normalize_prompt(prompt))
+        digest = history_digest(history)
+        now = time.time()
+        # Con la búsqueda aproximada desactivada (0) solo vale la misma pregunta normalizada
+        best_response, best_score = None, min_similarity if min_similarity > 0 else 1.0
+        with self._lock:
+            for response, created_at, other_grams, other_params in self._entries.values():
+                if self._expired(created_at, now) or params_digest(other_params) != digest:
+                    continue
+                score = similarity(grams, other_grams)
+                if score >= best_score:
+                    best_response, best_score = response, score
+        return best_response
+
+    def put(self, prompt, temperature, max_tokens, response, history=None):
+        key = make_key(prompt, temperature, max_tokens, history)
+        now = time.time()
+        with self._lock:
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, now)
+                )
+                self._db.commit()
+            self._remember(key, self._entry(key, response, now))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0
+        }
+
+
+# Caché compartida por todas las sesiones del proceso
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(os.path.join(CACHE_DIR, "responses.sqlite3"))
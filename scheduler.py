@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import streamlit as st
+
+from dispatcher import MAX_UPSTREAM_CONCURRENCY
+from resilience import LatencyTracker
+
+# Límite por sesión: consultas al agente por minuto y ráfaga máxima (variables de entorno)
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("TAMPA_RATE_LIMIT_PER_MINUTE", "10"))
+RATE_LIMIT_BURST = int(os.environ.get("TAMPA_RATE_LIMIT_BURST", "5"))
+# Los contadores de sesiones sin actividad se descartan pasado este tiempo (segundos)
+RATE_LIMIT_IDLE_TTL = 3600
+
+# Solicitudes simultáneas que el planificador deja pasar hacia el agente
+SCHEDULER_SLOTS = int(os.environ.get("TAMPA_SCHEDULER_SLOTS", str(MAX_UPSTREAM_CONCURRENCY)))
+# Espera máxima en la cola antes de rendirse (segundos)
+SCHEDULER_MAX_WAIT = float(os.environ.get("TAMPA_SCHEDULER_MAX_WAIT", "60"))
+
+# Prioridades: el chat interactivo siempre pasa antes que el trabajo en segundo plano
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_LABELS = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "background"}
+
+
+class QueueTimeout(TimeoutError):
+    pass
+
+
+# Cubeta de tokens: "rate" tokens por segundo hasta "capacity"
+class TokenBucket:
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+    # Consumir un token; devuelve 0 si se pudo o los segundos que faltan para el siguiente
+    def acquire(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def available(self, now=None):
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens
+
+
+# Limitador compartido por el proceso, con una cubeta por sesión/usuario
+class RateLimiter:
+    def __init__(self, per_minute=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, idle_ttl=RATE_LIMIT_IDLE_TTL):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.idle_ttl = idle_ttl
+        self.limited = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            # Descartar las cubetas inactivas (estarían llenas de todos modos)
+            for other_key in [k for k, b in self._buckets.items() if now - b.updated_at > self.idle_ttl]:
+                del self._buckets[other_key]
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def acquire(self, key):
+        now = time.monotonic()
+        with self._lock:
+            retry_after = self._bucket(key, now).acquire(now)
+            if retry_after:
+                self.limited += 1
+            return retry_after
+
+    def remaining(self, key):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            return self.burst if bucket is None else int(bucket.available(now))
+
+
+class _Ticket:
+    __slots__ = ("key", "priority", "enqueued_at", "granted")
+
+    def __init__(self, key, priority):
+        self.key = key
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+# Cola justa con prioridades delante del agente.
+# Dentro de cada prioridad se atiende por turnos (round-robin) a cada sesión,
+# de modo que quien envía muchas consultas no deja sin servicio a los demás.
+class FairScheduler:
+    def __init__(self, slots=SCHEDULER_SLOTS, max_wait=SCHEDULER_MAX_WAIT):
+        self.slots = max(1, slots)
+        self.max_wait = max_wait
+        self.active = 0
+        self.granted = 0
+        self.timeouts = 0
+        self.waits = {priority: LatencyTracker() for priority in PRIORITY_LABELS}
+        # prioridad -> {sesión: cola de tickets}, en orden de turno
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_LABELS}
+        self._condition = threading.Condition()
+
+    def _next_ticket(self):
+        for priority in sorted(self._queues):
+            queues = self._queues[priority]
+            if queues:
+                key, tickets = next(iter(queues.items()))
+                ticket = tickets.popleft()
+                # La sesión pasa al final del turno (o sale si no le quedan tickets)
+                del queues[key]
+                if tickets:
+                    queues[key] = tickets
+                return ticket
+        return None
+
+    def _dispatch(self):
+        while self.active < self.slots:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self.active += 1
+            self.granted += 1
+            self.waits[ticket.priority].record(time.monotonic() - ticket.enqueued_at)
+        self._condition.notify_all()
+
+    def _remove(self, ticket):
+        queues = self._queues[ticket.priority]
+        tickets = queues.get(ticket.key)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del queues[ticket.key]
+
+    # Esperar turno; devuelve los segundos en cola o lanza QueueTimeout
+    def acquire(self, key, priority=PRIORITY_INTERACTIVE, timeout=None):
+        timeout = self.max_wait if timeout is None else timeout
+        ticket = _Ticket(key, priority)
+        with self._condition:
+            self._queues[priority].setdefault(key, deque()).append(ticket)
+            self._dispatch()
+            deadline = ticket.enqueued_at + timeout
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._remove(ticket)
+                    self.timeouts += 1
+                    raise QueueTimeout(f"El asistente está atendiendo muchas consultas. Se esperó {timeout:.0f} s en la cola.")
+                self._condition.wait(remaining)
+        return time.monotonic() - ticket.enqueued_at
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, key, priority=PRIORITY_INTERACTIVE, timeout=None):
+        wait = self.acquire(key, priority, timeout)
+        try:
+            yield wait
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._condition:
+            queued = {
+                PRIORITY_LABELS[priority]: sum(len(tickets) for tickets in queues.values())
+                for priority, queues in self._queues.items()
+            }
+            active = self.active
+        return {
+            "active": active,
+            "slots": self.slots,
+            "queued": queued,
+            "granted": self.granted,
+            "timeouts": self.timeouts,
+            "wait_p50": self.waits[PRIORITY_INTERACTIVE].percentile(0.5),
+            "wait_p95": self.waits[PRIORITY_INTERACTIVE].percentile(0.95),
+            "background_wait_p95": self.waits[PRIORITY_BACKGROUND].percentile(0.95)
+        }
+
+
+# Limitador y planificador únicos por proceso
+@st.cache_resource
+def get_rate_limiter():
+    return RateLimiter()
+
+
+@st.cache_resource
+def get_scheduler():
+    return FairScheduler()
@@ -0,0 +1,163 @@
+import os
+import sys
+import threading
+import time
+
+import streamlit as st
+
+# Mensajes que una sesión mantiene en memoria; los anteriores se leen del almacén de conversaciones
+SESSION_MAX_MESSAGES = int(os.environ.get("TAMPA_SESSION_MAX_MESSAGES", "200"))
+# Tiempo sin actividad tras el que se libera la memoria de una sesión (segundos)
+SESSION_IDLE_TTL = float(os.environ.get("TAMPA_SESSION_IDLE_TTL", "1800"))
+# Frecuencia con la que se buscan sesiones inactivas (segundos)
+SESSION_SWEEP_INTERVAL = 60
+
+
+# Mensaje del historial con __slots__ (sin un dict por mensaje) y el rol internado.
+# Admite el acceso por clave (message["role"], message.get("error")) como los dicts que reemplaza.
+class ChatMessage:
+    __slots__ = ("role", "content", "seq", "error")
+
+    def __init__(self, role, content, seq=None, error=False):
+        self.role = sys.intern(role)
+        self.content = content
+        self.seq = seq
+        self.error = bool(error)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __contains__(self, key):
+        return key in self.__slots__ and (key != "error" or self.error)
+
+    def __repr__(self):
+        return f"ChatMessage({self.role!r}, {self.content[:40]!r}, seq={self.seq})"
+
+
+# Tamaño aproximado en memoria de un objeto y todo lo que referencia
+def deep_sizeof(value, seen=None):
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in value)
+    elif isinstance(value, (str, bytes, bytearray, int, float, bool, type(None))):
+        pass
+    else:
+        if hasattr(value, "__dict__"):
+            size += deep_sizeof(vars(value), seen)
+        for slot in getattr(type(value), "__slots__", ()):
+            if hasattr(value, slot):
+                size += deep_sizeof(getattr(value, slot), seen)
+    return size
+
+
+# Recortar el historial en memoria a los "keep" mensajes más recientes (siguen guardados en disco).
+# Devuelve cuántos se quitaron.
+def trim_messages(messages, keep=SESSION_MAX_MESSAGES):
+    excess = len(messages) - keep
+    if excess <= 0:
+        return 0
+    del messages[:excess]
+    return excess
+
+
+class _SessionEntry:
+    __slots__ = ("messages", "buffers", "last_seen", "trimmed")
+
+    def __init__(self, messages, buffers, last_seen):
+        self.messages = messages
+        self.buffers = buffers
+        self.last_seen = last_seen
+        self.trimmed = 0
+
+
+# Registro de las sesiones activas del proceso. Guarda referencias al historial y a los
+# búferes grandes de cada sesión (p. ej. el PDF) para poder medirlos y liberarlos cuando
+# la sesión queda inactiva. Una sesión liberada vuelve a cargar su historial del almacén.
+class SessionRegistry:
+    def __init__(self, idle_ttl=SESSION_IDLE_TTL, sweep_interval=SESSION_SWEEP_INTERVAL):
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.evicted = 0
+        self._sessions = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Marcar actividad de la sesión; devuelve False si no estaba registrada (nueva o liberada)
+    def touch(self, client_id, messages, buffers, trimmed=0):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(client_id)
+            known = entry is not None
+            if entry is None:
+                entry = self._sessions[client_id] = _SessionEntry(messages, buffers, now)
+            entry.messages = messages
+            entry.buffers = buffers
+            entry.last_seen = now
+            entry.trimmed += trimmed
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+        return known
+
+    # Inicio de una ejecución de la sesión: se marca activa antes de usar el historial, para
+    # que un barrido durante la ejecución no la libere. Devuelve False si no estaba registrada.
+    def begin(self, client_id):
+        with self._lock:
+            entry = self._sessions.get(client_id)
+            if entry is None:
+                return False
+            entry.last_seen = time.monotonic()
+            return True
+
+    def is_registered(self, client_id):
+        with self._lock:
+            return client_id in self._sessions
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        for client_id, entry in list(self._sessions.items()):
+            if now - entry.last_seen > self.idle_ttl:
+                # Vaciar en el sitio: la sesión conserva los mismos objetos pero sin contenido
+                entry.messages.clear()
+                entry.buffers.clear()
+                del self._sessions[client_id]
+                self.evicted += 1
+
+    def sweep(self):
+        with self._lock:
+            self._sweep(time.monotonic())
+
+    # Memoria estimada de cada sesión (para la vista de administración)
+    def report(self):
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._sessions.items())
+        rows = []
+        for client_id, entry in entries:
+            messages = list(entry.messages)
+            rows.append({
+                "session": client_id[:8],
+                "messages": len(messages),
+                "trimmed": entry.trimmed,
+                "history_bytes": deep_sizeof(messages),
+                "buffer_bytes": deep_sizeof(dict(entry.buffers)),
+                "idle_s": now - entry.last_seen
+            })
+        return sorted(rows, key=lambda row: row["history_bytes"] + row["buffer_bytes"], reverse=True)
+
+
+# Registro único por proceso
+@st.cache_resource
+def get_session_registry():
+    return SessionRegistry()
@@ -0,0 +1,192 @@
+import re
+
+import streamlit as st
+
+# Ejemplos de preguntas que se muestran al iniciar el chat
+EXAMPLE_QUESTIONS = [
+    ("🏠", "¿Qué servicios de limpieza residencial ofrecen?"),
+    ("🏢", "¿Cómo funciona la limpieza comercial de oficinas?"),
+    ("👔", "¿Cuáles son las políticas para empleados nuevos?"),
+    ("🧽", "¿Qué productos de limpieza debo usar para baños?"),
+    ("💰", "¿Cómo funcionan los pagos y cuándo se realizan?"),
+    ("📞", "¿Cuáles son los números de contacto de emergencia?"),
+    ("🕐", "¿Cómo solicito permisos y días libres?"),
+    ("🚨", "¿Qué hacer en caso de emergencias durante el servicio?"),
+]
+
+# Tema claro personalizado para Tampa Clean
+PAGE_CSS = """
+    /* Tema claro personalizado para Tampa Clean */
+    body {
+        color: #262626;
+        background-color: #ffffff;
+    }
+    .stApp {
+        background-color: #ffffff;
+    }
+    .stTextInput>div>div>input {
+        background-color: #f8f9fa;
+        color: #262626;
+        border: 1px solid #dee2e6;
+    }
+    .stSlider>div>div>div {
+        color: #262626;
+    }
+    .stSelectbox>div>div>div {
+        background-color: #f8f9fa;
+        color: #262626;
+    }
+    .css-1d391kg, .css-12oz5g7 {
+        background-color: #f8f9fa;
+    }
+
+    /* Estilos personalizados para Tampa Clean - Tema claro */
+    .main-header {
+        font-size: 2.5rem;
+        color: #004085;
+        text-align: center;
+        margin-bottom: 2rem;
+        font-weight: bold;
+        text-shadow: 1px 1px 2px rgba(0, 64, 133, 0.1);
+        border-bottom: 3px solid #007bff;
+        padding-bottom: 1rem;
+    }
+    .subheader {
+        font-size: 1.5rem;
+        color: #004085;
+        margin-bottom: 1rem;
+        font-weight: 600;
+    }
+    .footer {
+        position: fixed;
+        bottom: 0;
+        width: 100%;
+        background-color: #f8f9fa;
+        text-align: center;
+        padding: 10px;
+        font-size: 0.8rem;
+        border-top: 1px solid #dee2e6;
+        color: #6c757d;
+    }
+    /* Estilos para la barra lateral */
+    .sidebar .sidebar-content {
+        background-color: #f8f9fa;
+    }
+    .sidebar .sidebar-content h1,
+    .sidebar .sidebar-content h2,
+    .sidebar .sidebar-content h3,
+    .css-1outpf7 {
+        color: #004085 !important;
+    }
+
+    /* Estilos para los ejemplos de preguntas */
+    .example-questions {
+        background-color: #f8f9fa;
+        padding: 1.5rem;
+        border-radius: 10px;
+        border-left: 4px solid #007bff;
+        margin-bottom: 2rem;
+    }
+    .example-questions-title {
+        font-size: 1.1rem;
+        color: #004085;
+        margin-bottom: 1.5rem;
+        font-weight: 600;
+        font-family: 'Segoe UI', Arial, sans-serif;
+        text-align: center;
+    }
+    /* Dos columnas de ejemplos (una en pantallas estrechas) */
+    .example-grid {
+        display: grid;
+        grid-template-columns: repeat(2, minmax(0, 1fr));
+        gap: 1rem;
+        margin-bottom: 1rem;
+    }
+    .example-column {
+        background-color: rgba(0, 123, 255, 0.08);
+        padding: 1rem;
+        border-radius: 8px;
+        border-left: 3px solid #007bff;
+    }
+    .example-item {
+        margin-bottom: 0.8rem;
+        padding: 0.5rem;
+        background-color: rgba(0, 123, 255, 0.05);
+        border-radius: 4px;
+        font-weight: 500;
+        color: #004085;
+    }
+    @media (max-width: 640px) {
+        .example-grid {
+            grid-template-columns: 1fr;
+        }
+    }
+
+    /* Estilos para botones */
+    .stButton > button {
+        background-color: transparent;
+        color: #007bff;
+        border-radius: 5px;
+        border: 2px solid #007bff;
+        padding: 0.5rem 1rem;
+        font-weight: 500;
+    }
+    .stButton > button:hover {
+        background-color: rgba(0, 123, 255, 0.1);
+        color: #0056b3;
+        border-color: #0056b3;
+    }
+
+    /* Contenedor de mensajes de chat */
+    .stChatMessage {
+        background-color: #ffffff;
+        border: 1px solid #e9ecef;
+        border-radius: 8px;
+        margin-bottom: 1rem;
+    }
+"""
+
+FOOTER_TEXT = "🧽 Asistente Tampa Clean © 2025 | 📞 (813) 998-4553 | 💬 WhatsApp: (813) 365-9970 | 📧 manager@tampacleaning.org"
+
+
+# CSS sin comentarios ni espacios innecesarios
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+# El HTML estático se construye una vez por proceso y se reutiliza en todas las sesiones y reruns
+
+# Estilos y título en un solo elemento
+@st.cache_resource
+def page_header_html():
+    return (
+        f"<style>{minify_css(PAGE_CSS)}</style>"
+        "<h1 class='main-header'>🧽 Asistente Virtual Tampa Clean</h1>"
+    )
+
+
+# Subtítulo y ejemplos de preguntas en dos columnas (CSS grid en lugar de st.columns)
+@st.cache_resource
+def examples_html():
+    half = (len(EXAMPLE_QUESTIONS) + 1) // 2
+    columns = "".join(
+        "<div class='example-column'>"
+        + "".join(f"<div class='example-item'>{emoji} {question}</div>" for emoji, question in column)
+        + "</div>"
+        for column in (EXAMPLE_QUESTIONS[:half], EXAMPLE_QUESTIONS[half:])
+    )
+    return (
+        "<p class='subheader'>💬 Chatea con tu asistente virtual de Tampa Clean</p>"
+        "<div class='example-questions'>"
+        "<p class='example-questions-title'>💡 Ejemplos de preguntas que puedes hacer:</p>"
+        "</div>"
+        f"<div class='example-grid'>{columns}</div>"
+    )
+
+
+@st.cache_resource
+def footer_html():
+    return f"<div class='footer'>{FOOTER_TEXT}</div>"
@@ -0,0 +1,355 @@
+import concurrent.futures
+import hashlib
+import io
+import math
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+import wave
+from collections import OrderedDict
+
+import streamlit as st
+
+import metrics
+from response_cache import CACHE_DIR
+
+# Configuración de las respuestas por voz (variables de entorno)
+# Motor de síntesis: "gtts" (Google, requiere red) u "offline" (sin red, para pruebas)
+TTS_ENGINE = os.environ.get("TAMPA_TTS_ENGINE", "gtts")
+TTS_LANG = os.environ.get("TAMPA_TTS_LANG", "es")
+# Frases que se sintetizan en paralelo
+TTS_WORKERS = int(os.environ.get("TAMPA_TTS_WORKERS", "2"))
+# Tamaño máximo de la caché de audio en memoria y en disco (MB)
+TTS_MEMORY_MB = float(os.environ.get("TAMPA_TTS_MEMORY_MB", "32"))
+TTS_DISK_MB = float(os.environ.get("TAMPA_TTS_DISK_MB", "256"))
+# Tiempo máximo de espera por una frase (segundos)
+TTS_TIMEOUT = float(os.environ.get("TAMPA_TTS_TIMEOUT", "30"))
+
+# Las frases muy cortas se unen a la siguiente y las muy largas se cortan en comas o espacios
+MIN_CHUNK_CHARS = 24
+MAX_CHUNK_CHARS = 220
+
+SENTENCE_END = re.compile(r"(?<=[.!?…:;])\s+|\n+")
+
+
+# Texto de la respuesta sin marcas de markdown ni emojis (no se leen en voz alta)
+def speech_text(text):
+    text = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", text)
+    text = re.sub(r"[*_`~]+", "", text)
+    text = re.sub(r"[#>|]+", " ", text)
+    text = re.sub(r"^\s*(?:[-+•]|\d+\.)\s+", "", text, flags=re.MULTILINE)
+    text = "".join(ch for ch in text if unicodedata.category(ch) not in ("So", "Sk", "Cs", "Co") and ch != "\ufe0f")
+    return "\n".join(" ".join(line.split()) for line in text.splitlines())
+
+
+# Dividir el texto en frases para sintetizarlas por separado
+def split_sentences(text):
+    chunks = []
+    pending = ""
+    for sentence in SENTENCE_END.split(speech_text(text)):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        pending = f"{pending} {sentence}".strip()
+        while len(pending) > MAX_CHUNK_CHARS:
+            cut = pending.rfind(", ", 0, MAX_CHUNK_CHARS)
+            if cut < MAX_CHUNK_CHARS // 2:
+                cut = pending.rfind(" ", 0, MAX_CHUNK_CHARS)
+            if cut <= 0:
+                cut = MAX_CHUNK_CHARS
+            chunks.append(pending[:cut + 1].strip())
+            pending = pending[cut + 1:].strip()
+        if len(pending) >= MIN_CHUNK_CHARS:
+            chunks.append(pending)
+            pending = ""
+    if pending:
+        chunks.append(pending)
+    return chunks
+
+
+# --- Motores de síntesis -----------------------------------------------------
+
+# Google Text-to-Speech: MP3 (los fragmentos MP3 se pueden concatenar tal cual)
+class GTTSEngine:
+    name = "gtts"
+    mime = "audio/mpeg"
+    extension = "mp3"
+
+    def __init__(self, lang=TTS_LANG):
+        self.lang = lang
+
+    def synthesize(self, text):
+        # gTTS se importa solo al sintetizar por primera vez
+        from gtts import gTTS
+        audio = io.BytesIO()
+        gTTS(text, lang=self.lang).write_to_fp(audio)
+        return audio.getvalue()
+
+    def join(self, chunks):
+        return b"".join(chunks)
+
+
+# Motor sin red para pruebas y entornos aislados: un tono breve por frase con una duración
+# proporcional al texto (WAV mono de 16 bits)
+class OfflineEngine:
+    name = "offline"
+    mime = "audio/wav"
+    extension = "wav"
+    sample_rate = 8000
+    seconds_per_char = 0.06
+
+    def __init__(self, lang=TTS_LANG):
+        self.lang = lang
+
+    def synthesize(self, text):
+        frames = int(self.sample_rate * min(10.0, 0.2 + self.seconds_per_char * len(text)))
+        samples = (int(2000 * math.sin(2 * math.pi * 440 * i / self.sample_rate)) for i in range(frames))
+        return self._wav(struct.pack(f"<{frames}h", *samples))
+
+    def join(self, chunks):
+        pcm = b""
+        for chunk in chunks:
+            with wave.open(io.BytesIO(chunk)) as reader:
+                pcm += reader.readframes(reader.getnframes())
+        return self._wav(pcm)
+
+    def _wav(self, pcm):
+        audio = io.BytesIO()
+        with wave.open(audio, "wb") as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(self.sample_rate)
+            writer.writeframes(pcm)
+        return audio.getvalue()
+
+
+# Motores disponibles por nombre; se pueden registrar otros con register_engine
+ENGINES = {
+    GTTSEngine.name: GTTSEngine,
+    OfflineEngine.name: OfflineEngine
+}
+
+
+def register_engine(name, factory):
+    ENGINES[name] = factory
+
+
+def create_engine(name=TTS_ENGINE, lang=TTS_LANG):
+    if name not in ENGINES:
+        raise ValueError(f"Motor de voz desconocido: {name} (disponibles: {', '.join(sorted(ENGINES))})")
+    return ENGINES[name](lang=lang)
+
+
+# --- Caché de audio ----------------------------------------------------------
+
+# Caché LRU de audio direccionada por contenido: la clave es el hash del motor, el idioma y el
+# texto de la frase. En memoria (acotada en bytes) y en disco (un archivo por frase), de modo
+# que las respuestas frecuentes se sintetizan una sola vez aunque se reinicie la app.
+class AudioCache:
+    def __init__(self, directory=None, max_memory_bytes=TTS_MEMORY_MB * 1024 * 1024,
+                 max_disk_bytes=TTS_DISK_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # clave -> audio
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    @staticmethod
+    def make_key(engine, text):
+        return hashlib.sha256(f"{engine.name}|{engine.lang}|{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return audio
+        if self.directory:
+            try:
+                with open(self._path(key), "rb") as audio_file:
+                    audio = audio_file.read()
+                os.utime(self._path(key))  # uso reciente para el desalojo en disco
+            except OSError:
+                audio = None
+        with self._lock:
+            if audio is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, audio)
+        return audio
+
+    def put(self, key, audio):
+        if self.directory and not os.path.exists(self._path(key)):
+            temporary = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as audio_file:
+                audio_file.write(audio)
+            os.replace(temporary, self._path(key))
+            with self._lock:
+                self._disk_bytes += len(audio)
+                evict_disk = self._disk_bytes > self.max_disk_bytes
+            if evict_disk:
+                self._evict_disk()
+        with self._lock:
+            self._remember(key, audio)
+
+    def _remember(self, key, audio):
+        if key not in self._entries:
+            self._memory_bytes += len(audio)
+        self._entries[key] = audio
+        self._entries.move_to_end(key)
+        while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # Borrar los archivos usados hace más tiempo hasta quedar por debajo del 90 % del límite
+    def _evict_disk(self):
+        files = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".tmp")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        total = sum(entry.stat().st_size for entry in files)
+        for entry in files:
+            if total <= self.max_disk_bytes * 0.9:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_bytes": self._memory_bytes,
+            "disk_bytes": self._disk_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# --- Síntesis en segundo plano -----------------------------------------------
+
+# Respuesta hablada en curso: las frases se envían a sintetizar a medida que se completan
+# (también mientras la respuesta llega en streaming) y el audio se entrega en orden.
+# La reproducción empieza cuando están todas: lo que se ahorra es la síntesis, que se
+# solapa con la generación de la respuesta.
+class SpeechJob:
+    def __init__(self, synthesizer):
+        self.synthesizer = synthesizer
+        self.error = None
+        self._futures = []
+        self._buffer = ""
+
+    # Añadir texto de la respuesta; las frases completas empiezan a sintetizarse ya.
+    # Solo se corta donde la última frase no se uniría a la siguiente, para obtener las mismas
+    # frases (y las mismas claves de caché) que al sintetizar la respuesta completa.
+    def feed(self, text):
+        self._buffer += text
+        for boundary in reversed(list(SENTENCE_END.finditer(self._buffer))):
+            chunks = split_sentences(self._buffer[:boundary.end()])
+            if chunks and len(chunks[-1]) >= MIN_CHUNK_CHARS:
+                self._futures.extend(self.synthesizer.submit(chunk) for chunk in chunks)
+                self._buffer = self._buffer[boundary.end():]
+                break
+        return self
+
+    # Fin de la respuesta: sintetizar el resto
+    def finish(self):
+        self._futures.extend(self.synthesizer.submit(chunk) for chunk in split_sentences(self._buffer))
+        self._buffer = ""
+        return self
+
+    # Audio de cada frase en orden, a medida que está listo
+    def chunks(self, timeout=TTS_TIMEOUT):
+        for future in self._futures:
+            yield future.result(timeout=timeout)
+
+    # Audio completo de la respuesta, o None si alguna frase no se pudo sintetizar
+    def audio(self, timeout=TTS_TIMEOUT):
+        try:
+            chunks = list(self.chunks(timeout))
+        except Exception as e:
+            self.error = str(e) or type(e).__name__
+            return None
+        return self.synthesizer.engine.join(chunks) if chunks else None
+
+
+# Sintetizador compartido: un grupo pequeño de hilos, la caché de audio y una sola síntesis
+# por frase aunque varias sesiones la pidan a la vez. Los hilos no usan funciones de Streamlit.
+class SpeechSynthesizer:
+    def __init__(self, engine, cache, workers=TTS_WORKERS):
+        self.engine = engine
+        self.cache = cache
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tts")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        return SpeechJob(self)
+
+    # Future con el audio de una frase (inmediato si ya está en caché)
+    def submit(self, text):
+        key = AudioCache.make_key(self.engine, text)
+        audio = self.cache.get(key)
+        if audio is not None:
+            future = concurrent.futures.Future()
+            future.set_result(audio)
+            return future
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._executor.submit(self._synthesize, key, text)
+        return future
+
+    def _synthesize(self, key, text):
+        start = time.perf_counter()
+        try:
+            audio = self.engine.synthesize(text)
+            self.cache.put(key, audio)
+        except Exception as e:
+            metrics.registry.record("tts", status=self.engine.name, total=time.perf_counter() - start,
+                                    request_bytes=len(text.encode("utf-8")), error=str(e) or type(e).__name__)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        metrics.registry.record("tts", status=self.engine.name, total=time.perf_counter() - start,
+                                request_bytes=len(text.encode("utf-8")), response_bytes=len(audio))
+        return audio
+
+    # Audio ya sintetizado de un texto completo (sin sintetizar nada); None si falta alguna frase
+    def cached_audio(self, text):
+        chunks = []
+        for chunk in split_sentences(text):
+            audio = self.cache.get(AudioCache.make_key(self.engine, chunk))
+            if audio is None:
+                return None
+            chunks.append(audio)
+        return self.engine.join(chunks) if chunks else None
+
+
+# Sintetizador único por proceso
+@st.cache_resource
+def get_speech_synthesizer():
+    engine = create_engine()
+    return SpeechSynthesizer(engine, AudioCache(os.path.join(CACHE_DIR, "tts", engine.name)))
@@ -0,0 +1,137 @@
+# Formato de las solicitudes al agente: JSON compacto (orjson si está instalado), cuerpo
+# comprimido (gzip o zstd) cuando el endpoint lo admite y lectura rápida de las respuestas.
+import gzip
+import json
+import os
+import threading
+
+try:
+    import orjson
+except ImportError:  # JSON de la biblioteca estándar
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # solo gzip
+    zstandard = None
+
+# Compresión del cuerpo de las solicitudes (variables de entorno):
+#   "auto": solo si el endpoint anuncia en sus respuestas que la admite (cabecera Accept-Encoding)
+#   "gzip"/"zstd": siempre (si el endpoint la rechaza se desactiva para ese endpoint)
+#   "none": nunca
+REQUEST_COMPRESSION = os.environ.get("TAMPA_REQUEST_COMPRESSION", "auto").lower()
+# Los cuerpos pequeños no se comprimen (no compensa el coste de CPU)
+COMPRESS_MIN_BYTES = int(os.environ.get("TAMPA_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+# Un endpoint rechaza un cuerpo comprimido con 415 (RFC 7694) o con un 400 cuyo mensaje habla de
+# la codificación; cualquier otro 400 es un error de la solicitud y no se reenvía sin comprimir
+COMPRESSION_REJECTED_STATUS = 415
+COMPRESSION_ERROR_HINTS = (b"encoding", b"compress", b"gzip", b"zstd")
+
+
+def supported_encodings():
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+# ¿La respuesta (código y cuerpo) indica que el endpoint no admite el cuerpo comprimido?
+def compression_rejected(status_code, body):
+    if status_code == COMPRESSION_REJECTED_STATUS:
+        return True
+    if status_code != 400:
+        return False
+    body = body.lower()
+    return any(hint in body for hint in COMPRESSION_ERROR_HINTS)
+
+
+# --- JSON ----------------------------------------------------------------------
+
+def dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    # Sin espacios y con UTF-8 directo (los acentos ocupan 2 bytes en lugar de los 6 de \u00e1)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# --- Compresión ----------------------------------------------------------------
+
+def compress(body, encoding):
+    if encoding == "gzip":
+        # mtime=0: mismo contenido, mismos bytes
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return body
+
+
+def decompress(body, encoding):
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+
+# Compresión que admite cada endpoint, aprendida de sus respuestas. Compartido por todos los
+# hilos del proceso (como metrics.registry), sin depender de Streamlit.
+class EncodingNegotiator:
+    def __init__(self, mode=REQUEST_COMPRESSION, min_bytes=COMPRESS_MIN_BYTES):
+        self.mode = mode
+        self.min_bytes = min_bytes
+        self._accepted = {}  # url -> codificaciones anunciadas por el endpoint
+        self._rejected = {}  # url -> codificaciones que el endpoint rechazó
+        self._lock = threading.Lock()
+
+    # Codificación para un cuerpo de "size" bytes enviado a "url" (None = sin comprimir)
+    def choose(self, url, size):
+        if self.mode == "none" or size < self.min_bytes:
+            return None
+        with self._lock:
+            rejected = self._rejected.get(url, ())
+            if self.mode in ("gzip", "zstd"):
+                candidates = (self.mode,) if self.mode in supported_encodings() else ()
+            else:
+                accepted = self._accepted.get(url, ())
+                candidates = [encoding for encoding in supported_encodings() if encoding in accepted]
+        return next((encoding for encoding in candidates if encoding not in rejected), None)
+
+    # Leer la cabecera Accept-Encoding de una respuesta (RFC 7694)
+    def observe(self, url, headers):
+        advertised = headers.get("Accept-Encoding")
+        if advertised is None:
+            return
+        encodings = {part.split(";")[0].strip().lower() for part in advertised.split(",")}
+        with self._lock:
+            self._accepted[url] = encodings
+
+    def reject(self, url, encoding):
+        with self._lock:
+            self._rejected[url] = self._rejected.get(url, ()) + (encoding,)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "accepted": {url: sorted(encodings) for url, encodings in self._accepted.items()},
+                "rejected": dict(self._rejected)
+            }
+
+
+# Negociación compartida por el proceso
+negotiator = EncodingNegotiator()
+
+
+# Cuerpo de una solicitud: (bytes, codificación o None)
+def encode_request(payload, url, negotiator=negotiator):
+    body = dumps(payload)
+    encoding = negotiator.choose(url, len(body))
+    if encoding is None:
+        return body, None
+    return compress(body, encoding), encoding